@@ -5,12 +5,63 @@ Loads clip metadata and provides search/filter capabilities for the selector.
 """
 
 import json
+import mmap
+import os
+import re
+import sys
+from bisect import bisect_right
+from collections import Counter
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 from dataclasses import dataclass, field
 
+try:
+    import ijson  # optional: incremental parsing for very large manifests
+except ImportError:
+    ijson = None
 
-@dataclass
+try:
+    import orjson  # optional: faster full-file parsing
+except ImportError:
+    orjson = None
+
+# Manifests larger than this are streamed entry-by-entry when ijson is available
+STREAM_THRESHOLD_BYTES = 256 * 1024 * 1024
+
+# Boolean Clip attributes packed into per-flag bitsets (bit i = clip i)
+CLIP_FLAGS = ("has_speech", "has_music", "starts_clean", "ends_clean")
+
+# Separates clip records in the packed search buffer so matches cannot span clips
+_RECORD_SEP = "\x00"
+
+# Column order for the pipe-delimited selector batch (keys of to_selector_context)
+SELECTOR_COLUMNS = (
+    "filename", "duration", "description", "mood", "setting", "subjects",
+    "tags", "has_speech", "speech_preview", "motion", "colors",
+)
+
+
+def _intern(value):
+    """Intern a repeated, low-cardinality string (non-strings pass through)."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _intern_list(values: list) -> list:
+    return [_intern(v) for v in values]
+
+
+def _selector_cell(value) -> str:
+    """Render one selector context value as a pipe-safe table cell."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, list):
+        value = ", ".join(value)
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+@dataclass(slots=True)
 class Clip:
     """Represents a single video clip with its metadata."""
     filename: str
@@ -35,30 +86,56 @@ class Clip:
     starts_clean: bool
     ends_clean: bool
     suggested_tags: list[str]
-    raw_data: dict = field(repr=False)
+    raw_data: Optional[dict] = field(default=None, repr=False)
+    _searchable: str = field(init=False, repr=False, compare=False, default="")
+    _selector_row: str = field(init=False, repr=False, compare=False, default="")
+    _selector_context: Optional[dict] = field(init=False, repr=False, compare=False, default=None)
+    _tags_lower: frozenset = field(init=False, repr=False, compare=False, default=frozenset())
+    
+    def __post_init__(self) -> None:
+        # Lowercased tag set, shared by the loader's tag index
+        self._tags_lower = frozenset(sys.intern(t.lower()) for t in self.suggested_tags)
+        # Lowercased text blob for matches_query, built once per clip
+        self._searchable = " ".join([
+            self.description,
+            self.setting,
+            self.mood,
+            self.visual_style,
+            " ".join(self.subjects),
+            " ".join(self.suggested_tags),
+            self.speech_transcript or "",
+        ]).lower()
+        # Pre-rendered, pre-truncated row for get_selector_batch_columnar
+        context = self.to_selector_context()
+        self._selector_row = "|".join(_selector_cell(context[k]) for k in SELECTOR_COLUMNS)
     
     @classmethod
-    def from_json(cls, data: dict) -> "Clip":
-        """Create a Clip from raw JSON manifest entry."""
+    def from_json(cls, data: dict, keep_raw: bool = False) -> "Clip":
+        """Create a Clip from raw JSON manifest entry.
+        
+        The entry dict is only retained as raw_data when keep_raw is set.
+        """
         tech = data.get("technical", {})
         analysis = data.get("analysis", {})
         audio = analysis.get("audio", {})
         
+        # Categorical fields repeat heavily across clips, so intern them;
+        # description and transcript are effectively unique and left alone.
         return cls(
             filename=data.get("filename", ""),
             file_path=data.get("filePath", ""),
             duration=tech.get("durationSeconds", 0),
             width=tech.get("width", 0),
             height=tech.get("height", 0),
-            aspect_ratio=tech.get("aspectRatio", ""),
+            aspect_ratio=_intern(tech.get("aspectRatio", "")),
             description=analysis.get("description", ""),
-            subjects=analysis.get("subjects", []),
-            setting=analysis.get("setting", ""),
-            mood=analysis.get("mood", ""),
-            visual_style=analysis.get("visualStyle", ""),
-            dominant_colors=analysis.get("dominantColors", []),
-            camera_work=analysis.get("cameraWork", ""),
-            motion_intensity=analysis.get("motionIntensity", ""),
+            subjects=_intern_list(analysis.get("subjects", [])),
+            setting=_intern(analysis.get("setting", "")),
+            mood=_intern(analysis.get("mood", "")),
+            visual_style=_intern(analysis.get("visualStyle", "")),
+            dominant_colors=_intern_list(analysis.get("dominantColors", [])),
+            camera_work=_intern(analysis.get("cameraWork", "")),
+            motion_intensity=_intern(analysis.get("motionIntensity", "")),
             has_speech=audio.get("hasSpeech", False),
             speech_transcript=audio.get("speechTranscript"),
             has_music=audio.get("hasMusic", False),
@@ -66,26 +143,26 @@ class Clip:
             ambient_sounds=audio.get("ambientSounds"),
             starts_clean=analysis.get("startsClean", True),
             ends_clean=analysis.get("endsClean", True),
-            suggested_tags=analysis.get("suggestedTags", []),
-            raw_data=data
+            suggested_tags=_intern_list(analysis.get("suggestedTags", [])),
+            raw_data=data if keep_raw else None
         )
     
     def matches_query(self, query: str) -> bool:
         """Simple text search across key fields."""
-        query_lower = query.lower()
-        searchable = " ".join([
-            self.description,
-            self.setting,
-            self.mood,
-            self.visual_style,
-            " ".join(self.subjects),
-            " ".join(self.suggested_tags),
-            self.speech_transcript or "",
-        ]).lower()
-        return query_lower in searchable
+        return query.lower() in self._searchable
     
     def to_selector_context(self) -> dict:
-        """Return a condensed version for the LLM selector."""
+        """
+        Return a condensed version for the LLM selector.
+        
+        Built once and cached; clips are not mutated after construction,
+        so callers should treat the returned dict as read-only.
+        """
+        if self._selector_context is None:
+            self._selector_context = self._build_selector_context()
+        return self._selector_context
+    
+    def _build_selector_context(self) -> dict:
         return {
             "filename": self.filename,
             "duration": self.duration,
@@ -104,31 +181,140 @@ class Clip:
 class ManifestLoader:
     """Loads and manages the clip manifest."""
     
-    def __init__(self, manifest_path: Optional[str] = None, clips_base_path: Optional[str] = None):
+    def __init__(
+        self,
+        manifest_path: Optional[str] = None,
+        clips_base_path: Optional[str] = None,
+        keep_raw: bool = False
+    ):
         self.clips: list[Clip] = []
         self.clips_by_filename: dict[str, Clip] = {}
         self.clips_base_path = Path(clips_base_path) if clips_base_path else None
+        self.keep_raw = keep_raw  # retain each entry's parsed JSON on Clip.raw_data
+        
+        # Posting lists (clip indices) built once at load time
+        self._tag_index: dict[str, set[int]] = {}
+        self._mood_index: dict[str, set[int]] = {}
+        self._motion_index: dict[str, set[int]] = {}
+        self._flag_bits: dict[str, int] = dict.fromkeys(CLIP_FLAGS, 0)
+        self._all_bits: int = 0
+        self._total_duration: float = 0
+        
+        # All searchable blobs packed into one string, with per-clip start offsets
+        self._search_blob: str = ""
+        self._search_offsets: list[int] = []
+        
+        # Histogram caches, reset whenever the clip list changes
+        self._tag_counts_cache: Optional[dict[str, int]] = None
+        self._mood_counts_cache: Optional[dict[str, int]] = None
         
         if manifest_path:
             self.load(manifest_path)
     
     def load(self, manifest_path: str) -> None:
         """Load manifest from JSON file."""
-        with open(manifest_path, 'r') as f:
-            data = json.load(f)
+        if ijson is not None and os.path.getsize(manifest_path) > STREAM_THRESHOLD_BYTES:
+            with open(manifest_path, 'rb') as f:
+                self.clips = [Clip.from_json(c, self.keep_raw) for c in self._stream_entries(f)]
+        else:
+            data = self._parse_file(manifest_path)
+            
+            # Handle both array format and object-with-clips format
+            if isinstance(data, list):
+                clip_list = data
+            elif isinstance(data, dict) and "clips" in data:
+                clip_list = data["clips"]
+            else:
+                raise ValueError("Manifest must be a JSON array or object with 'clips' key")
+            
+            self.clips = [Clip.from_json(c, self.keep_raw) for c in clip_list]
+
+        self.clips_by_filename = {c.filename: c for c in self.clips}
+        self._build_indices()
+        self._tag_counts_cache = None
+        self._mood_counts_cache = None
+        
+        print(f"Loaded {len(self.clips)} clips from manifest")
+    
+    @staticmethod
+    def _parse_file(manifest_path: str):
+        """Parse a whole manifest file, memory-mapping it when orjson is available."""
+        if orjson is None:
+            return json.loads(Path(manifest_path).read_bytes())
         
-        # Handle both array format and object-with-clips format
-        if isinstance(data, list):
-            clip_list = data
-        elif isinstance(data, dict) and "clips" in data:
-            clip_list = data["clips"]
+        fd = os.open(manifest_path, os.O_RDONLY)
+        try:
+            if os.fstat(fd).st_size == 0:
+                return orjson.loads(b"")  # mmap refuses empty files; raise the usual decode error
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            # orjson parses straight from the mapped pages, skipping the read() copy
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                return orjson.loads(view)
+        finally:
+            os.close(fd)
+    
+    @staticmethod
+    def _stream_entries(f) -> Iterator[dict]:
+        """Yield manifest entries one at a time without parsing the whole file."""
+        # Sniff the first non-whitespace byte to pick array vs object-with-clips
+        first = b""
+        while not first.strip():
+            first = f.read(1)
+            if not first:
+                raise ValueError("Manifest must be a JSON array or object with 'clips' key")
+        f.seek(0)
+        
+        if first == b"[":
+            prefix = "item"
+        elif first == b"{":
+            prefix = "clips.item"
         else:
             raise ValueError("Manifest must be a JSON array or object with 'clips' key")
         
-        self.clips = [Clip.from_json(c) for c in clip_list]
-        self.clips_by_filename = {c.filename: c for c in self.clips}
+        yield from ijson.items(f, prefix, use_float=True)
+    
+    def _build_indices(self) -> None:
+        """Build lowercased posting lists for tags, moods, motion and flags."""
+        self._tag_index = {}
+        self._mood_index = {}
+        self._motion_index = {}
+        # Built from binary strings: OR-ing 1 << i per clip would be quadratic
+        self._flag_bits = {
+            name: int("0" + "".join("1" if getattr(c, name) else "0" for c in reversed(self.clips)), 2)
+            for name in CLIP_FLAGS
+        }
+        self._all_bits = (1 << len(self.clips)) - 1
+        self._total_duration = sum(c.duration for c in self.clips)
         
-        print(f"Loaded {len(self.clips)} clips from manifest")
+        for i, clip in enumerate(self.clips):
+            for tag in clip._tags_lower:
+                self._tag_index.setdefault(tag, set()).add(i)
+            # Moods are free text matched by substring, so index the whole string
+            self._mood_index.setdefault(clip.mood.lower(), set()).add(i)
+            self._motion_index.setdefault(clip.motion_intensity.lower(), set()).add(i)
+        
+        offsets = []
+        pos = 0
+        for clip in self.clips:
+            offsets.append(pos)
+            pos += len(clip._searchable) + len(_RECORD_SEP)
+        self._search_offsets = offsets
+        self._search_blob = _RECORD_SEP.join(c._searchable for c in self.clips)
+    
+    def _clips_at(self, idxs: set[int]) -> list[Clip]:
+        """Materialize clips for a set of indices, preserving manifest order."""
+        return [self.clips[i] for i in sorted(idxs)]
+    
+    def _clips_in_bits(self, bits: int) -> list[Clip]:
+        """Materialize clips whose bit is set, preserving manifest order."""
+        digits = format(bits, "b")[::-1]  # digits[i] is clip i
+        result = []
+        i = digits.find("1")
+        while i != -1:
+            result.append(self.clips[i])
+            i = digits.find("1", i + 1)
+        return result
     
     def get_clip(self, filename: str) -> Optional[Clip]:
         """Get a specific clip by filename."""
@@ -142,72 +328,125 @@ class ManifestLoader:
     
     def search(self, query: str) -> list[Clip]:
         """Simple text search across all clips."""
-        return [c for c in self.clips if c.matches_query(query)]
+        query_lower = query.lower()
+        if not query_lower or _RECORD_SEP in query_lower:
+            return [c for c in self.clips if query_lower in c._searchable]
+        
+        # One C-level find() over the packed buffer; after each hit, resume at
+        # the next record so every clip is reported at most once.
+        blob = self._search_blob
+        offsets = self._search_offsets
+        results = []
+        pos = blob.find(query_lower)
+        while pos != -1:
+            i = bisect_right(offsets, pos) - 1
+            results.append(self.clips[i])
+            if i + 1 >= len(offsets):
+                break
+            pos = blob.find(query_lower, offsets[i + 1])
+        return results
     
     def filter_by_mood(self, mood_keywords: list[str]) -> list[Clip]:
         """Filter clips by mood keywords (any match)."""
         mood_keywords_lower = [m.lower() for m in mood_keywords]
-        return [
-            c for c in self.clips 
-            if any(kw in c.mood.lower() for kw in mood_keywords_lower)
-        ]
+        if len(mood_keywords_lower) <= 2:
+            def matches(mood: str) -> bool:
+                return any(kw in mood for kw in mood_keywords_lower)
+        else:
+            # One alternation scan per mood instead of one substring scan per keyword
+            pattern = re.compile("|".join(map(re.escape, mood_keywords_lower)))
+            def matches(mood: str) -> bool:
+                return pattern.search(mood) is not None
+        
+        idxs: set[int] = set()
+        for mood, postings in self._mood_index.items():
+            if matches(mood):
+                idxs |= postings
+        return self._clips_at(idxs)
     
     def filter_by_tags(self, tags: list[str], match_all: bool = False) -> list[Clip]:
         """Filter clips by tags."""
-        tags_lower = set(t.lower() for t in tags)
-        
-        def clip_matches(clip: Clip) -> bool:
-            clip_tags = set(t.lower() for t in clip.suggested_tags)
-            if match_all:
-                return tags_lower.issubset(clip_tags)
-            return bool(tags_lower & clip_tags)
-        
-        return [c for c in self.clips if clip_matches(c)]
+        postings = [self._tag_index.get(t.lower(), set()) for t in set(tags)]
+        if not postings:
+            return list(self.clips) if match_all else []
+        combine = set.intersection if match_all else set.union
+        return self._clips_at(combine(*postings))
     
     def filter_by_motion(self, intensity: str) -> list[Clip]:
         """Filter by motion intensity: low, medium, high."""
-        return [c for c in self.clips if c.motion_intensity.lower() == intensity.lower()]
+        return self._clips_at(self._motion_index.get(intensity.lower(), set()))
+    
+    def filter_by_flags(
+        self,
+        has_speech: Optional[bool] = None,
+        has_music: Optional[bool] = None,
+        starts_clean: Optional[bool] = None,
+        ends_clean: Optional[bool] = None
+    ) -> list[Clip]:
+        """Filter clips on any combination of boolean flags (None = don't care)."""
+        wanted = {
+            "has_speech": has_speech,
+            "has_music": has_music,
+            "starts_clean": starts_clean,
+            "ends_clean": ends_clean,
+        }
+        bits = self._all_bits
+        for name, value in wanted.items():
+            if value is not None:
+                flag = self._flag_bits[name]
+                bits &= flag if value else ~flag
+        return self._clips_in_bits(bits)
     
     def filter_has_speech(self, has_speech: bool = True) -> list[Clip]:
         """Filter clips by whether they have speech."""
-        return [c for c in self.clips if c.has_speech == has_speech]
+        return self.filter_by_flags(has_speech=has_speech)
     
     def filter_clean_cuts(self, starts_clean: bool = True, ends_clean: bool = True) -> list[Clip]:
         """Filter clips that have clean start/end points for editing."""
-        return [
-            c for c in self.clips 
-            if c.starts_clean == starts_clean and c.ends_clean == ends_clean
-        ]
+        return self.filter_by_flags(starts_clean=starts_clean, ends_clean=ends_clean)
     
     def get_all_tags(self) -> dict[str, int]:
         """Get all tags with their frequency counts."""
-        tag_counts: dict[str, int] = {}
-        for clip in self.clips:
-            for tag in clip.suggested_tags:
-                tag_counts[tag] = tag_counts.get(tag, 0) + 1
-        return dict(sorted(tag_counts.items(), key=lambda x: -x[1]))
+        if self._tag_counts_cache is None:
+            tag_counts: Counter[str] = Counter()
+            for clip in self.clips:
+                tag_counts.update(clip.suggested_tags)
+            self._tag_counts_cache = dict(tag_counts.most_common())
+        return self._tag_counts_cache
     
     def get_all_moods(self) -> dict[str, int]:
         """Get all unique mood strings with counts."""
-        mood_counts: dict[str, int] = {}
-        for clip in self.clips:
-            mood_counts[clip.mood] = mood_counts.get(clip.mood, 0) + 1
-        return dict(sorted(mood_counts.items(), key=lambda x: -x[1]))
+        if self._mood_counts_cache is None:
+            mood_counts = Counter(clip.mood for clip in self.clips)
+            self._mood_counts_cache = dict(mood_counts.most_common())
+        return self._mood_counts_cache
     
     def get_selector_batch(self, clips: list[Clip], max_clips: int = 50) -> list[dict]:
         """Get a batch of clips formatted for the LLM selector."""
         return [c.to_selector_context() for c in clips[:max_clips]]
     
+    def get_selector_batch_columnar(self, clips: list[Clip], max_clips: int = 50) -> str:
+        """
+        Get a batch of clips as a pipe-delimited table for the LLM selector.
+        
+        The first line is the column header; each following line is one clip.
+        Much more compact than a JSON list of dicts, which repeats every key.
+        """
+        rows = ["|".join(SELECTOR_COLUMNS)]
+        rows.extend(c._selector_row for c in clips[:max_clips])
+        return "\n".join(rows)
+    
     def stats(self) -> dict:
         """Get summary statistics about the manifest."""
-        total_duration = sum(c.duration for c in self.clips)
+        # Everything here is read off the load-time indices, not the clip objects
+        total_duration = self._total_duration
         return {
             "total_clips": len(self.clips),
             "total_duration_seconds": total_duration,
             "total_duration_minutes": round(total_duration / 60, 1),
-            "with_speech": len([c for c in self.clips if c.has_speech]),
-            "with_music": len([c for c in self.clips if c.has_music]),
-            "clean_cuts": len([c for c in self.clips if c.starts_clean and c.ends_clean]),
+            "with_speech": self._flag_bits["has_speech"].bit_count(),
+            "with_music": self._flag_bits["has_music"].bit_count(),
+            "clean_cuts": (self._flag_bits["starts_clean"] & self._flag_bits["ends_clean"]).bit_count(),
             "unique_tags": len(self.get_all_tags()),
         }
 
@@ -8,9 +8,14 @@ Main loop that coordinates:
 - Buffer maintenance
 """
 
+import asyncio
 import json
+import logging
 import threading
 import time
+from concurrent.futures import Future
+from logging.handlers import QueueHandler, QueueListener
+from queue import Empty, SimpleQueue
 from typing import Optional
 from dataclasses import dataclass
 
@@ -18,8 +23,10 @@ from manifest_loader import ManifestLoader
 from selector import Selector
 from playback import PlaybackController, DummyPlaybackController
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+@dataclass(slots=True)
 class OrchestratorConfig:
     """Configuration for the orchestrator."""
     # Buffer settings
@@ -31,10 +38,14 @@ class OrchestratorConfig:
     
     # Timing
     poll_interval: float = 1.0  # How often to check buffer status
+    estimated_llm_latency: float = 5.0  # Initial guess; refined from observed selections
     
     # Playback
     use_dummy_playback: bool = False  # Use dummy controller (no mpv)
     fullscreen: bool = False
+    
+    # Logging
+    log_level: str = "INFO"  # Level for buffer-loop / selection messages
 
 
 class Orchestrator:
@@ -55,6 +66,7 @@ class Orchestrator:
         config: Optional[OrchestratorConfig] = None
     ):
         self.config = config or OrchestratorConfig()
+        logger.setLevel(self.config.log_level)
         
         # Initialize components
         print("Loading manifest...")
@@ -68,13 +80,23 @@ class Orchestrator:
             self.playback = DummyPlaybackController(clips_base_path)
         else:
             self.playback = PlaybackController(clips_base_path=clips_base_path)
+        self.playback.set_clip_durations({c.filename: c.duration for c in self.manifest.clips})
         
         # State
         self.running = False
-        self.queued_filenames: list[str] = []
+        # Insertion-ordered, with O(1) membership and removal
+        self.queued_filenames: dict[str, None] = {}
         self._buffer_thread: Optional[threading.Thread] = None
-        self._feedback_queue: list[str] = []
-        self._lock = threading.Lock()
+        self._stop_event = threading.Event()  # wakes the buffer loop on stop()
+        self._feedback_queue: SimpleQueue[str] = SimpleQueue()
+        
+        # Speculative selection: aselect() runs on a private event loop while
+        # the current clip plays; the buffer loop collects the result
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_thread: Optional[threading.Thread] = None
+        self._pending_selection: Optional[Future] = None
+        self._pending_started = 0.0
+        self._llm_latency = self.config.estimated_llm_latency
         
         # Stats
         self.clips_played = 0
@@ -89,8 +111,6 @@ class Orchestrator:
             print("Failed to start mpv")
             return False
         
-        time.sleep(0.5)
-        
         if not self.config.use_dummy_playback:
             if not self.playback.connect():
                 print("Failed to connect to mpv")
@@ -103,8 +123,14 @@ class Orchestrator:
         # Start playback
         self.playback.play()
         
+        # Event loop for speculative selections
+        self._async_loop = asyncio.new_event_loop()
+        self._async_thread = threading.Thread(target=self._async_loop.run_forever, daemon=True)
+        self._async_thread.start()
+        
         # Start buffer management thread
         self.running = True
+        self._stop_event.clear()
         self._buffer_thread = threading.Thread(target=self._buffer_loop, daemon=True)
         self._buffer_thread.start()
         
@@ -115,30 +141,46 @@ class Orchestrator:
         """Stop the orchestrator."""
         print("\nStopping orchestrator...")
         self.running = False
+        self._stop_event.set()
         
         if self._buffer_thread:
             self._buffer_thread.join(timeout=2.0)
         
+        if self._pending_selection is not None:
+            self._pending_selection.cancel()
+            self._pending_selection = None
+        if self._async_loop is not None:
+            self._async_loop.call_soon_threadsafe(self._async_loop.stop)
+            self._async_thread.join(timeout=2.0)
+            self._async_loop.close()
+            self._async_loop = None
+        
         self.playback.stop_mpv()
         print("Orchestrator stopped.")
     
     def _buffer_loop(self) -> None:
         """Background loop to maintain playback buffer."""
-        while self.running:
+        while not self._stop_event.wait(self.config.poll_interval):
             try:
                 # Check buffer status
                 buffer_time = self.playback.get_queue_duration()
                 
-                if buffer_time < self.config.min_buffer_seconds:
-                    print(f"\n[Buffer low: {buffer_time:.1f}s] Selecting more clips...")
-                    self._fill_buffer()
+                # Start the next selection early enough that it lands before
+                # the buffer drops below the minimum
+                if (self._pending_selection is None
+                        and buffer_time < self.config.min_buffer_seconds + self._llm_latency):
+                    logger.info("[Buffer: %.1fs] Selecting more clips...", buffer_time)
+                    self._start_selection()
                 
-                # Process any queued feedback
-                with self._lock:
-                    feedback_to_process = self._feedback_queue.copy()
-                    self._feedback_queue.clear()
+                if self._pending_selection is not None and self._pending_selection.done():
+                    self._finish_selection()
                 
-                for feedback in feedback_to_process:
+                # Process any queued feedback
+                while True:
+                    try:
+                        feedback = self._feedback_queue.get_nowait()
+                    except Empty:
+                        break
                     self.selector.process_feedback(feedback)
                 
                 # Update played clips tracking
@@ -146,61 +188,83 @@ class Orchestrator:
                 if status.filename:
                     self._mark_current_as_played(status.filename)
                 
-            except Exception as e:
-                print(f"Buffer loop error: {e}")
-            
-            time.sleep(self.config.poll_interval)
+            except Exception:
+                logger.exception("Buffer loop error")
+    
+    def _exclude_filenames(self) -> set[str]:
+        """Recently played plus already queued filenames."""
+        # Snapshot the incrementally maintained view: async selections read it
+        # on the event loop thread while this thread keeps updating the state
+        return set(self.selector.state.exclude_set)
     
     def _fill_buffer(self) -> None:
-        """Select and queue clips to fill the buffer."""
-        # Get exclusion list (recently played + already queued)
-        exclude = [p["filename"] for p in self.selector.state.recently_played]
-        exclude.extend(self.queued_filenames)
-        
-        # Select clips
+        """Select and queue clips to fill the buffer (blocking)."""
         result = self.selector.select(
             num_selections=self.config.clips_per_selection,
-            exclude_filenames=exclude
+            exclude_filenames=self._exclude_filenames()
         )
-        
+        self._queue_selections(result)
+    
+    def _start_selection(self) -> None:
+        """Schedule an async selection on the event loop without waiting for it."""
+        self._pending_started = time.monotonic()
+        self._pending_selection = asyncio.run_coroutine_threadsafe(
+            self.selector.aselect(
+                num_selections=self.config.clips_per_selection,
+                exclude_filenames=self._exclude_filenames()
+            ),
+            self._async_loop
+        )
+    
+    def _finish_selection(self) -> None:
+        """Queue the result of a completed async selection."""
+        future, self._pending_selection = self._pending_selection, None
+        # Smooth the latency estimate that decides how early to prefetch
+        elapsed = time.monotonic() - self._pending_started
+        self._llm_latency = 0.7 * self._llm_latency + 0.3 * elapsed
+        self._queue_selections(future.result())
+    
+    def _queue_selections(self, result: dict) -> None:
+        """Add a selector result to the playback queue."""
         if "error" in result:
-            print(f"Selection error: {result['error']}")
+            logger.warning("Selection error: %s", result["error"])
             return
         
         selections = result.get("selections", [])
         if not selections:
-            print("No clips selected!")
+            logger.warning("No clips selected!")
             return
         
         # Add to playback queue
         for sel in selections:
             filename = sel["filename"]
             if self.playback.add_to_playlist(filename):
-                self.queued_filenames.append(filename)
-                print(f"  Queued: {filename}")
-                print(f"    Reason: {sel.get('reasoning', 'N/A')}")
+                if filename not in self.queued_filenames:
+                    self.queued_filenames[filename] = None
+                    self.selector.state.add_queued(filename)
+                logger.info("  Queued: %s", filename)
+                logger.info("    Reason: %s", sel.get("reasoning", "N/A"))
             else:
-                print(f"  Failed to queue: {filename}")
+                logger.warning("  Failed to queue: %s", filename)
         
         self.selections_made += 1
         
         # Show narrative info
         if result.get("narrative_note"):
-            print(f"\n  Narrative: {result['narrative_note']}")
+            logger.info("  Narrative: %s", result["narrative_note"])
         if result.get("suggested_direction"):
-            print(f"  Suggested direction: {result['suggested_direction']}")
+            logger.info("  Suggested direction: %s", result["suggested_direction"])
     
     def _mark_current_as_played(self, filename: str) -> None:
         """Mark the current file as played and remove from queue."""
         if filename in self.queued_filenames:
-            self.queued_filenames.remove(filename)
+            del self.queued_filenames[filename]
             self.selector.mark_played(filename)
             self.clips_played += 1
     
     def add_feedback(self, feedback: str) -> None:
         """Add user feedback (thread-safe)."""
-        with self._lock:
-            self._feedback_queue.append(feedback)
+        self._feedback_queue.put(feedback)
         print(f"Feedback queued: {feedback}")
     
     def set_coherence(self, level: float) -> None:
@@ -224,10 +288,25 @@ class Orchestrator:
             "selections_made": self.selections_made,
             "coherence": self.selector.state.coherence_level,
             "direction": self.selector.state.direction,
-            "mood_trajectory": self.selector.state.mood_trajectory[-5:],
+            "mood_trajectory": list(self.selector.state.mood_trajectory)[-5:],
         }
 
 
+def _start_log_listener() -> QueueListener:
+    """
+    Route orchestrator logging through a queue so the buffer thread never
+    blocks on terminal I/O; a listener thread does the actual writes.
+    """
+    log_queue: SimpleQueue = SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
 def main():
     """Interactive orchestrator session."""
     import sys
@@ -263,6 +342,7 @@ def main():
         clips_per_selection=3,
     )
     
+    log_listener = _start_log_listener()
     orchestrator = Orchestrator(manifest_path, clips_base_path, config)
     
     if not orchestrator.start():
@@ -342,6 +422,7 @@ def main():
         print(f"  Clips played: {orchestrator.clips_played}")
         print(f"  Selections made: {orchestrator.selections_made}")
         print(f"  Final direction: {orchestrator.selector.state.direction}")
+        log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -5,13 +5,24 @@ Controls mpv via JSON IPC for playlist management and playback status.
 """
 
 import json
+import selectors
 import socket
 import subprocess
+import threading
 import time
 import os
 from pathlib import Path
 from typing import Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+
+# Fallback estimate for playlist items whose duration is unknown
+DEFAULT_CLIP_DURATION = 8.0
+
+# mpv properties pushed to us via observe_property (observer id = position + 1)
+OBSERVED_PROPERTIES = (
+    "idle-active", "pause", "filename", "time-pos",
+    "duration", "playlist-count", "playlist-pos",
+)
 
 
 @dataclass
@@ -36,8 +47,27 @@ class PlaybackController:
     def __init__(self, socket_path: str = "/tmp/mpv-socket", clips_base_path: Optional[str] = None):
         self.socket_path = socket_path
         self.clips_base_path = Path(clips_base_path) if clips_base_path else None
+        # Stringified once so get_full_path can skip pathlib on the hot path
+        self._base_path_str = str(self.clips_base_path) if self.clips_base_path else ""
         self._socket: Optional[socket.socket] = None
         self._mpv_process: Optional[subprocess.Popen] = None
+        self._next_request_id = 0
+        # Persistent receive buffer; bytes [0:_recv_len] hold a partial line
+        self._recvbuf = bytearray(65536)
+        self._recv_view = memoryview(self._recvbuf)
+        self._recv_len = 0
+        self._duration_cache: dict[str, float] = {}  # full path -> seconds
+        
+        # A reader thread owns all socket reads: it files command replies into
+        # _replies and applies property-change events to _status.
+        self._reader: Optional[threading.Thread] = None
+        self._reader_stop = threading.Event()
+        self._send_lock = threading.Lock()
+        # Outgoing newline-delimited commands not yet written (guarded by _send_lock)
+        self._outq = bytearray()
+        self._cond = threading.Condition()
+        self._replies: dict[int, Optional[dict]] = {}
+        self._status = PlaybackStatus()
     
     def start_mpv(self, fullscreen: bool = False) -> bool:
         """Start mpv with IPC enabled."""
@@ -62,11 +92,8 @@ class PlaybackController:
                 stderr=subprocess.DEVNULL
             )
             
-            # Wait for socket to be ready
-            for _ in range(50):  # 5 seconds max
-                time.sleep(0.1)
-                if os.path.exists(self.socket_path):
-                    return True
+            if self._wait_for_socket(timeout=5.0):
+                return True
             
             print("Warning: mpv started but socket not ready")
             return False
@@ -75,6 +102,34 @@ class PlaybackController:
             print("Error: mpv not found. Install with: apt install mpv")
             return False
     
+    def _wait_for_socket(self, timeout: float) -> bool:
+        """
+        Wait until mpv accepts connections on the IPC socket.
+        
+        Probes with a real connect() rather than checking the path exists, so a
+        socket file that is bound but not yet listening counts as not ready.
+        Backs off from 5ms to 50ms between attempts.
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while True:
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                return True
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass
+            finally:
+                probe.close()
+            
+            # mpv exited (bad flags, no display...): no point waiting out the timeout
+            if self._mpv_process and self._mpv_process.poll() is not None:
+                return False
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+    
     def _cleanup_socket(self) -> None:
         """Remove stale socket file."""
         try:
@@ -83,28 +138,50 @@ class PlaybackController:
             pass
     
     def connect(self) -> bool:
-        """Connect to mpv IPC socket."""
+        """Connect to mpv IPC socket and subscribe to playback property changes."""
         if self._socket:
             return True
         
         try:
-            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-            self._socket.connect(self.socket_path)
-            self._socket.setblocking(False)
-            return True
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+            sock.setblocking(False)
         except (socket.error, FileNotFoundError) as e:
             print(f"Failed to connect to mpv: {e}")
-            self._socket = None
             return False
+        
+        self._socket = sock
+        self._recv_len = 0
+        with self._cond:
+            self._status = PlaybackStatus()
+        self._reader_stop = threading.Event()
+        self._reader = threading.Thread(
+            target=self._reader_loop, args=(sock, self._reader_stop), daemon=True
+        )
+        self._reader.start()
+        
+        self._send_commands([
+            ["observe_property", i, name]
+            for i, name in enumerate(OBSERVED_PROPERTIES, start=1)
+        ])
+        return self._socket is not None
     
     def disconnect(self) -> None:
         """Disconnect from mpv."""
-        if self._socket:
+        sock = self._socket
+        if sock:
+            self._socket = None
+            # Unsent commands belong to this connection; never replay them after a reconnect
+            with self._send_lock:
+                self._outq.clear()
+            self._reader_stop.set()
+            if self._reader and self._reader is not threading.current_thread():
+                self._reader.join(timeout=1.0)
+            self._reader = None
             try:
-                self._socket.close()
+                sock.close()
             except Exception:
                 pass
-            self._socket = None
     
     def stop_mpv(self) -> None:
         """Stop the mpv process."""
@@ -117,46 +194,197 @@ class PlaybackController:
     
     def _send_command(self, command: list) -> Optional[dict]:
         """Send a command to mpv and get response."""
+        return self._send_commands([command])[0]
+    
+    def _send_commands(self, commands: list[list], timeout: float = 2.0) -> list[Optional[dict]]:
+        """
+        Send several commands in a single write and collect their responses.
+        
+        Each command is tagged with a request_id so replies can be matched
+        regardless of order or interleaved mpv events. Returns one response
+        (or None) per command, in the order given.
+        """
+        if not commands:
+            return []
         if not self._socket and not self.connect():
-            return None
+            return [None] * len(commands)
         
-        msg = json.dumps({"command": command}) + "\n"
+        sock = self._socket
+        stop = self._reader_stop
+        if sock is None:  # disconnected by another thread in the meantime
+            return [None] * len(commands)
         
-        try:
-            self._socket.send(msg.encode())
+        with self._send_lock:
+            ids = []
+            for command in commands:
+                self._next_request_id += 1
+                ids.append(self._next_request_id)
+                self._outq += json.dumps(
+                    {"command": command, "request_id": self._next_request_id}
+                ).encode()
+                self._outq += b"\n"
             
-            # Read response (may need multiple reads)
-            response = b""
-            self._socket.setblocking(True)
-            self._socket.settimeout(2.0)
+            with self._cond:
+                for request_id in ids:
+                    self._replies[request_id] = None
             
-            while True:
-                chunk = self._socket.recv(4096)
-                response += chunk
-                if b"\n" in response:
-                    break
-            
-            self._socket.setblocking(False)
-            return json.loads(response.decode().strip())
-            
-        except (socket.error, json.JSONDecodeError) as e:
-            print(f"Command failed: {e}")
-            self._socket = None
+            # One write carries all of these commands
+            error = self._flush_locked(sock)
+        
+        with self._cond:
+            if error is None:
+                self._cond.wait_for(
+                    lambda: stop.is_set() or all(self._replies[i] is not None for i in ids),
+                    timeout
+                )
+            responses = [self._replies.pop(i) for i in ids]
+        
+        if error is None and None in responses:
+            if stop.is_set():
+                error = ConnectionError("mpv IPC connection lost")
+            else:
+                error = socket.timeout("timed out waiting for mpv response")
+        
+        if error is not None:
+            print(f"Command failed: {error}")
+            if self._socket is sock:
+                self.disconnect()
+            return [None] * len(commands)
+        return responses
+    
+    def _post(self, command: list) -> bool:
+        """Send a fire-and-forget command (no reply is awaited)."""
+        if not self._socket and not self.connect():
+            return False
+        with self._send_lock:
+            self._outq += json.dumps({"command": command}).encode()
+            self._outq += b"\n"
+        return self.flush()
+    
+    def flush(self) -> bool:
+        """Write any queued commands in a single send."""
+        sock = self._socket
+        if sock is None:
+            return False
+        with self._send_lock:
+            error = self._flush_locked(sock)
+        if error is not None:
+            print(f"Command failed: {error}")
+            if self._socket is sock:
+                self.disconnect()
+            return False
+        return True
+    
+    def _flush_locked(self, sock: socket.socket) -> Optional[OSError]:
+        """sendall() the write buffer (caller holds _send_lock); returns the error, if any."""
+        if not self._outq:
             return None
+        try:
+            sock.sendall(self._outq)
+        except socket.error as e:
+            return e
+        finally:
+            self._outq.clear()
+        return None
+    
+    def _reader_loop(self, sock: socket.socket, stop: threading.Event) -> None:
+        """Background reader: dispatch replies and property-change events."""
+        # One epoll/kqueue registration for the life of the connection
+        with selectors.DefaultSelector() as sel:
+            sel.register(sock, selectors.EVENT_READ)
+            while not stop.is_set():
+                try:
+                    if not sel.select(timeout=0.2):
+                        continue
+                    messages = self._recv_messages(sock)
+                except (OSError, ValueError) as e:
+                    if not stop.is_set():
+                        print(f"mpv IPC reader stopped: {e}")
+                        stop.set()
+                    with self._cond:
+                        self._cond.notify_all()
+                    return
+                
+                with self._cond:
+                    for msg in messages:
+                        if msg.get("event") == "property-change":
+                            self._apply_property(msg.get("name"), msg.get("data"))
+                        elif msg.get("request_id") in self._replies:
+                            self._replies[msg["request_id"]] = msg
+                    self._cond.notify_all()
+    
+    def _apply_property(self, name: Optional[str], value) -> None:
+        """Update the cached status from an observed property (caller holds _cond)."""
+        status = self._status
+        if name == "idle-active":
+            status.playing = not (value or False)
+        elif name == "pause":
+            status.paused = value or False
+        elif name == "filename":
+            status.filename = value
+        elif name == "time-pos":
+            status.position = value or 0.0
+        elif name == "duration":
+            status.duration = value or 0.0
+        elif name == "playlist-count":
+            status.playlist_count = value or 0
+        elif name == "playlist-pos":
+            status.playlist_pos = value or 0
+    
+    def _recv_messages(self, sock: socket.socket) -> list[dict]:
+        """Read once from the socket into the receive buffer and parse any complete lines."""
+        if self._recv_len == len(self._recvbuf):
+            # A single message filled the buffer: grow it (the view must be released first)
+            self._recv_view.release()
+            self._recvbuf.extend(bytes(len(self._recvbuf)))
+            self._recv_view = memoryview(self._recvbuf)
+        
+        n = sock.recv_into(self._recv_view[self._recv_len:])
+        if not n:
+            raise ConnectionError("mpv closed the IPC socket")
+        end = self._recv_len + n
+        
+        messages = []
+        start = 0
+        # Only the newly received bytes can contain a line terminator
+        newline = self._recvbuf.find(b"\n", self._recv_len, end)
+        while newline != -1:
+            line = self._recvbuf[start:newline]
+            if line.strip():
+                messages.append(json.loads(line))
+            start = newline + 1
+            newline = self._recvbuf.find(b"\n", start, end)
+        
+        # Shift the trailing partial line to the front for the next read
+        self._recv_len = end - start
+        if start:
+            self._recv_view[:self._recv_len] = self._recv_view[start:end]
+        return messages
     
     def _get_property(self, name: str) -> Optional[any]:
         """Get an mpv property."""
-        result = self._send_command(["get_property", name])
-        if result and result.get("error") == "success":
-            return result.get("data")
-        return None
+        return self._get_properties([name])[name]
+    
+    def _get_properties(self, names: list[str]) -> dict[str, Optional[any]]:
+        """Get several mpv properties in one IPC round-trip."""
+        results = self._send_commands([["get_property", name] for name in names])
+        return {
+            name: result.get("data") if result and result.get("error") == "success" else None
+            for name, result in zip(names, results)
+        }
     
     def get_full_path(self, filename: str) -> str:
         """Get full path for a clip filename."""
-        if self.clips_base_path:
-            return str(self.clips_base_path / filename)
+        if self._base_path_str:
+            return os.path.join(self._base_path_str, filename)
         return filename
     
+    def set_clip_durations(self, durations: dict[str, float]) -> None:
+        """Seed known clip durations (keyed by clip filename) for queue estimates."""
+        for filename, duration in durations.items():
+            if duration:
+                self._duration_cache[self.get_full_path(filename)] = duration
+    
     def add_to_playlist(self, filename: str, play_now: bool = False) -> bool:
         """Add a file to the playlist."""
         path = self.get_full_path(filename)
@@ -170,26 +398,23 @@ class PlaybackController:
     
     def add_multiple(self, filenames: list[str]) -> int:
         """Add multiple files to playlist. Returns count of successfully added."""
-        added = 0
-        for fn in filenames:
-            if self.add_to_playlist(fn):
-                added += 1
-        return added
+        # Pipelined: every loadfile goes out in one write, replies drained together
+        results = self._send_commands([
+            ["loadfile", self.get_full_path(fn), "append"] for fn in filenames
+        ])
+        return sum(1 for r in results if r is not None and r.get("error") == "success")
     
     def clear_playlist(self) -> bool:
         """Clear the playlist."""
-        result = self._send_command(["playlist-clear"])
-        return result is not None
+        return self._post(["playlist-clear"])
     
     def play(self) -> bool:
         """Start/resume playback."""
-        result = self._send_command(["set_property", "pause", False])
-        return result is not None
+        return self._post(["set_property", "pause", False])
     
     def pause(self) -> bool:
         """Pause playback."""
-        result = self._send_command(["set_property", "pause", True])
-        return result is not None
+        return self._post(["set_property", "pause", True])
     
     def next(self) -> bool:
         """Skip to next item in playlist."""
@@ -208,18 +433,11 @@ class PlaybackController:
         return result is not None
     
     def get_status(self) -> PlaybackStatus:
-        """Get current playback status."""
-        status = PlaybackStatus()
-        
-        status.playing = not (self._get_property("idle-active") or False)
-        status.paused = self._get_property("pause") or False
-        status.filename = self._get_property("filename")
-        status.position = self._get_property("time-pos") or 0.0
-        status.duration = self._get_property("duration") or 0.0
-        status.playlist_count = self._get_property("playlist-count") or 0
-        status.playlist_pos = self._get_property("playlist-pos") or 0
-        
-        return status
+        """Get current playback status (kept current by mpv property events)."""
+        if not self._socket and not self.connect():
+            return PlaybackStatus()
+        with self._cond:
+            return replace(self._status)
     
     def get_playlist(self) -> list[dict]:
         """Get the current playlist."""
@@ -237,14 +455,19 @@ class PlaybackController:
         """Estimate total duration of remaining playlist items."""
         status = self.get_status()
         playlist = self.get_playlist()
+        pos = status.playlist_pos
         
         # Current file remaining
-        remaining = self.get_remaining_time()
+        remaining = 0.0
+        if status.duration > 0:
+            remaining = status.duration - status.position
+            # Remember the real duration now that mpv has reported it
+            if 0 <= pos < len(playlist):
+                self._duration_cache[playlist[pos].get("filename")] = status.duration
         
-        # Add assumed duration for remaining files (rough estimate)
-        # In reality we'd want to know actual durations
-        remaining_files = len(playlist) - status.playlist_pos - 1
-        remaining += remaining_files * 8  # Assume 8 sec average
+        # Add known (or assumed) durations for the files still to come
+        for item in playlist[pos + 1:]:
+            remaining += self._duration_cache.get(item.get("filename"), DEFAULT_CLIP_DURATION)
         
         return remaining
     
@@ -266,7 +489,7 @@ class DummyPlaybackController:
         self.current_pos: int = 0
         self.playing: bool = False
         self.start_time: float = 0
-        self._clip_duration: float = 8.0  # Assumed duration
+        self._clip_duration: float = DEFAULT_CLIP_DURATION  # Assumed duration
     
     def start_mpv(self, fullscreen: bool = False) -> bool:
         print("[DUMMY] mpv 'started'")
@@ -281,6 +504,9 @@ class DummyPlaybackController:
     def stop_mpv(self) -> None:
         print("[DUMMY] mpv 'stopped'")
     
+    def set_clip_durations(self, durations: dict[str, float]) -> None:
+        pass  # simulated clips all last _clip_duration
+    
     def add_to_playlist(self, filename: str, play_now: bool = False) -> bool:
         if play_now:
             self.playlist = [filename]
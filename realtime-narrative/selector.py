@@ -5,40 +5,191 @@ Uses an LLM to select clips based on narrative state and user feedback.
 Supports configurable coherence levels from pure dream logic to strict narrative.
 """
 
+import hashlib
 import json
 import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import AbstractSet, Iterable, Optional
 from datetime import datetime
+from itertools import islice
+from string import Template
 import anthropic
 
+try:
+    import orjson  # optional: faster prompt serialization and response parsing
+except ImportError:
+    orjson = None
+
 from manifest_loader import ManifestLoader, Clip
 
+# Feedback keywords that steer the narrative direction (earlier entries win)
+DIRECTION_KEYWORDS = {
+    "darker": "exploring darker themes",
+    "lighter": "moving toward lighter, brighter content",
+    "faster": "increasing energy and pace",
+    "slower": "slowing down, contemplative",
+    "abstract": "embracing abstraction and surrealism",
+    "narrative": "building toward clearer narrative",
+    "emotional": "focusing on emotional resonance",
+    "violent": "exploring conflict and tension",
+    "peaceful": "seeking calm and serenity",
+    "weird": "leaning into the strange and surreal",
+    "funny": "looking for humor and levity",
+}
+# Recent selection results reused when the narrative context repeats
+SELECTION_CACHE_SIZE = 128
+SELECTION_CACHE_TTL = 120.0  # seconds before a cached result is refreshed
+
+_DIRECTION_PRIORITY = {kw: i for i, kw in enumerate(DIRECTION_KEYWORDS)}
+_DIRECTION_PATTERN = re.compile("|".join(map(re.escape, DIRECTION_KEYWORDS)))
+
+# Static prompt chrome, parsed once; build_prompt only fills the slots
+_PROMPT_TEMPLATE = Template("""You are selecting video clips for a real-time narrative experience. Your selections will be played in sequence to create an evolving visual story.
+
+## COHERENCE LEVEL: $coherence_level
+$coherence_desc
+
+## CURRENT NARRATIVE DIRECTION
+$direction
+
+## RECENTLY PLAYED CLIPS (most recent last)
+$recently_played
+
+## MOOD TRAJECTORY
+$mood_trajectory
+
+## RECENT USER FEEDBACK (most recent last)
+$feedback
+
+## AVAILABLE CLIPS (pipe-delimited, first line is the header)
+$available_clips
+
+## YOUR TASK
+Select $num_selections clips to add to the queue. Consider:
+1. How they flow from what was recently played
+2. The user's feedback and desired direction
+3. The coherence level (low = dream logic ok, high = narrative continuity required)
+4. Variety in visual style, motion, and mood while maintaining thematic threads
+5. Whether clips have speech that might conflict or enhance
+
+Return ONLY valid JSON in this exact format:
+{
+  "selections": [
+    {
+      "filename": "exact_filename.mp4",
+      "reasoning": "Brief explanation of why this clip fits"
+    }
+  ],
+  "narrative_note": "Brief note on where the narrative seems to be heading",
+  "suggested_direction": "Optional suggestion for evolving the narrative direction"
+}""")
+
+
+def _loads(text: str):
+    """Parse JSON text, preferring orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _dumps(obj, indent: bool = False) -> str:
+    """Serialize to JSON text (compact unless indent), preferring orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _extract_json(text: str) -> Optional[str]:
+    """
+    Return the first balanced {...} object in text, or None.
+    
+    Single linear pass that counts braces outside of string literals, so
+    prose or markdown fences around the JSON cost nothing extra.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def _tail(items: deque, n: int) -> list:
+    """Last n items of a deque as a list (deques don't support slicing)."""
+    return list(islice(items, max(len(items) - n, 0), None))
+
 
 @dataclass
 class NarrativeState:
     """Tracks the current state of the narrative experience."""
     direction: str = "open exploration"
     coherence_level: float = 0.3  # 0.0 = pure dream, 1.0 = strict narrative
-    recently_played: list[dict] = field(default_factory=list)
+    # Bounded histories: appends evict the oldest entry in O(1)
+    recently_played: deque[dict] = field(default_factory=lambda: deque(maxlen=10))
     current_queue: list[str] = field(default_factory=list)  # filenames
-    feedback_history: list[dict] = field(default_factory=list)
-    mood_trajectory: list[str] = field(default_factory=list)
+    feedback_history: deque[dict] = field(default_factory=lambda: deque(maxlen=10))
+    mood_trajectory: deque[str] = field(default_factory=lambda: deque(maxlen=15))
+    # Reference counts of filenames in recently_played + current_queue
+    _exclude_counts: Counter = field(default_factory=Counter, init=False, repr=False)
+    
+    @property
+    def exclude_set(self) -> AbstractSet[str]:
+        """Live set view of recently played and queued filenames."""
+        return self._exclude_counts.keys()
+    
+    def _release(self, filename: str) -> None:
+        self._exclude_counts[filename] -= 1
+        if self._exclude_counts[filename] <= 0:
+            del self._exclude_counts[filename]
+    
+    def add_queued(self, filename: str) -> None:
+        """Record a clip as queued for playback."""
+        self.current_queue.append(filename)
+        self._exclude_counts[filename] += 1
     
     def add_played(self, clip: Clip) -> None:
         """Record a clip as played."""
+        # Keep the exclude counts in step with the history's eviction
+        if len(self.recently_played) == self.recently_played.maxlen:
+            self._release(self.recently_played[0]["filename"])
+        self._exclude_counts[clip.filename] += 1
+        if clip.filename in self.current_queue:
+            self.current_queue.remove(clip.filename)
+            self._release(clip.filename)
+        
         self.recently_played.append({
             "filename": clip.filename,
             "description": clip.description[:150],
             "mood": clip.mood,
             "played_at": datetime.now().isoformat()
         })
-        # Keep last 10
-        self.recently_played = self.recently_played[-10:]
         
         # Track mood trajectory
         self.mood_trajectory.append(clip.mood)
-        self.mood_trajectory = self.mood_trajectory[-15:]
     
     def add_feedback(self, feedback: str) -> None:
         """Record user feedback."""
@@ -46,21 +197,19 @@ class NarrativeState:
             "text": feedback,
             "at": datetime.now().isoformat()
         })
-        # Keep last 10
-        self.feedback_history = self.feedback_history[-10:]
     
     def get_recent_feedback(self, n: int = 5) -> list[str]:
         """Get the N most recent feedback strings."""
-        return [f["text"] for f in self.feedback_history[-n:]]
+        return [f["text"] for f in _tail(self.feedback_history, n)]
     
     def to_context(self) -> dict:
         """Export state for the selector prompt."""
         return {
             "direction": self.direction,
             "coherence_level": self.coherence_level,
-            "recently_played": self.recently_played[-5:],
+            "recently_played": _tail(self.recently_played, 5),
             "recent_feedback": self.get_recent_feedback(5),
-            "mood_trajectory": self.mood_trajectory[-5:],
+            "mood_trajectory": _tail(self.mood_trajectory, 5),
             "queued_count": len(self.current_queue)
         }
 
@@ -72,55 +221,42 @@ class Selector:
         self.manifest = manifest
         self.model = model
         self.client = anthropic.Anthropic()  # Uses ANTHROPIC_API_KEY env var
+        self.aclient = anthropic.AsyncAnthropic()  # for aselect()
         self.state = NarrativeState()
+        
+        # Context digest -> (stored_at, result); shared by select() and aselect()
+        self._cache: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
+        # Motion bucket per clip, computed once rather than on every sample
+        self._motion_group: dict[str, str] = {
+            c.filename: self._motion_bucket(c.motion_intensity) for c in manifest.clips
+        }
     
-    def build_prompt(self, available_clips: list[dict], num_selections: int = 3) -> str:
-        """Build the selection prompt."""
+    def build_prompt(self, available_clips: str, num_selections: int = 3) -> str:
+        """Build the selection prompt from a columnar clip batch."""
         state_ctx = self.state.to_context()
         
-        coherence_desc = self._coherence_description(state_ctx["coherence_level"])
-        
-        prompt = f"""You are selecting video clips for a real-time narrative experience. Your selections will be played in sequence to create an evolving visual story.
-
-## COHERENCE LEVEL: {state_ctx['coherence_level']:.1f}
-{coherence_desc}
-
-## CURRENT NARRATIVE DIRECTION
-{state_ctx['direction']}
-
-## RECENTLY PLAYED CLIPS (most recent last)
-{json.dumps(state_ctx['recently_played'], indent=2) if state_ctx['recently_played'] else "None yet - this is the beginning."}
-
-## MOOD TRAJECTORY
-{' → '.join(state_ctx['mood_trajectory']) if state_ctx['mood_trajectory'] else "Not established yet."}
-
-## RECENT USER FEEDBACK (most recent last)
-{self._format_feedback(state_ctx['recent_feedback'])}
-
-## AVAILABLE CLIPS
-{json.dumps(available_clips, indent=2)}
-
-## YOUR TASK
-Select {num_selections} clips to add to the queue. Consider:
-1. How they flow from what was recently played
-2. The user's feedback and desired direction
-3. The coherence level (low = dream logic ok, high = narrative continuity required)
-4. Variety in visual style, motion, and mood while maintaining thematic threads
-5. Whether clips have speech that might conflict or enhance
-
-Return ONLY valid JSON in this exact format:
-{{
-  "selections": [
-    {{
-      "filename": "exact_filename.mp4",
-      "reasoning": "Brief explanation of why this clip fits"
-    }}
-  ],
-  "narrative_note": "Brief note on where the narrative seems to be heading",
-  "suggested_direction": "Optional suggestion for evolving the narrative direction"
-}}"""
+        if state_ctx["recently_played"]:
+            recently_played = _dumps(state_ctx["recently_played"])
+        else:
+            recently_played = "None yet - this is the beginning."
         
-        return prompt
+        if state_ctx["mood_trajectory"]:
+            mood_trajectory = " → ".join(state_ctx["mood_trajectory"])
+        else:
+            mood_trajectory = "Not established yet."
+        
+        return _PROMPT_TEMPLATE.substitute(
+            coherence_level=f"{state_ctx['coherence_level']:.1f}",
+            coherence_desc=self._coherence_description(state_ctx["coherence_level"]),
+            direction=state_ctx["direction"],
+            recently_played=recently_played,
+            mood_trajectory=mood_trajectory,
+            feedback=self._format_feedback(state_ctx["recent_feedback"]),
+            available_clips=available_clips,
+            num_selections=num_selections,
+        )
     
     def _coherence_description(self, level: float) -> str:
         """Get a description of what the coherence level means."""
@@ -141,56 +277,155 @@ Return ONLY valid JSON in this exact format:
             return "No feedback yet."
         return "\n".join(f"- \"{f}\"" for f in feedback)
     
-    def select(self, num_selections: int = 3, exclude_filenames: Optional[list[str]] = None) -> dict:
+    def select(
+        self,
+        num_selections: int = 3,
+        exclude_filenames: Optional[Iterable[str]] = None
+    ) -> dict:
         """
         Select clips using the LLM.
         
         Args:
             num_selections: How many clips to select
-            exclude_filenames: Filenames to exclude (e.g., recently played, already queued)
+            exclude_filenames: Filenames to exclude (e.g., recently played, already queued).
+                A set is used as-is; any other iterable is converted once.
         
         Returns:
             Dict with selections and metadata
         """
-        exclude = set(exclude_filenames or [])
-        
-        # Get available clips (excluding already used ones)
-        available = [c for c in self.manifest.clips if c.filename not in exclude]
-        
-        if not available:
+        exclude = self._exclude_set(exclude_filenames)
+        key = self._cache_key(num_selections, exclude)
+        cached = self._cache_get(key, exclude)
+        if cached is not None:
+            return cached
+        
+        prompt = self._prepare_prompt(num_selections, exclude)
+        if prompt is None:
             return {"error": "No available clips", "selections": []}
         
-        # Convert to selector context format
-        available_context = [c.to_selector_context() for c in available]
-        
-        # If we have too many clips, we need to be smart about which to show the LLM
-        # For now, simple approach: take a sample that includes variety
-        if len(available_context) > 50:
-            available_context = self._smart_sample(available, 50)
-        
-        prompt = self.build_prompt(available_context, num_selections)
-        
         # Call the LLM
         response = self.client.messages.create(
             model=self.model,
             max_tokens=1024,
             messages=[{"role": "user", "content": prompt}]
         )
+        result = self._parse_response(response.content[0].text)
+        self._cache_put(key, result)
+        return result
+    
+    async def aselect(
+        self,
+        num_selections: int = 3,
+        exclude_filenames: Optional[Iterable[str]] = None
+    ) -> dict:
+        """
+        Async variant of select() using the async client.
+        
+        Lets callers issue the next selection while the current clip is still
+        playing, so LLM latency stays off the playback critical path.
+        """
+        exclude = self._exclude_set(exclude_filenames)
+        key = self._cache_key(num_selections, exclude)
+        cached = self._cache_get(key, exclude)
+        if cached is not None:
+            return cached
+        
+        prompt = self._prepare_prompt(num_selections, exclude)
+        if prompt is None:
+            return {"error": "No available clips", "selections": []}
+        
+        response = await self.aclient.messages.create(
+            model=self.model,
+            max_tokens=1024,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        result = self._parse_response(response.content[0].text)
+        self._cache_put(key, result)
+        return result
+    
+    @staticmethod
+    def _exclude_set(exclude_filenames: Optional[Iterable[str]]) -> AbstractSet[str]:
+        """A set is used as-is; any other iterable is converted once."""
+        if isinstance(exclude_filenames, AbstractSet):
+            return exclude_filenames
+        return set(exclude_filenames or ())
+    
+    def _cache_key(self, num_selections: int, exclude: AbstractSet[str]) -> bytes:
+        """Digest of everything in the prompt that depends on narrative state."""
+        state = self.state
+        recent = "|".join(p["filename"] for p in _tail(state.recently_played, 5))
+        moods = "|".join(_tail(state.mood_trajectory, 5))
+        feedback = "|".join(state.get_recent_feedback(5))
+        excluded = "|".join(sorted(exclude))
+        # Raw coherence, not the prompt's "{:.1f}": the prompt's description
+        # buckets on the unrounded value (0.19 and 0.2 read differently)
+        text = (f"{num_selections}\x00{state.coherence_level!r}\x00{state.direction}\x00"
+                f"{recent}\x00{moods}\x00{feedback}\x00{excluded}")
+        return hashlib.blake2b(text.encode(), digest_size=16).digest()
+    
+    def _cache_get(self, key: bytes, exclude: AbstractSet[str]) -> Optional[dict]:
+        """Return a fresh cached result minus excluded clips, or None on a miss."""
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > SELECTION_CACHE_TTL:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+        
+        selections = [sel for sel in result["selections"] if sel["filename"] not in exclude]
+        if not selections:
+            return None
+        return {**result, "selections": selections}
+    
+    def _cache_put(self, key: bytes, result: dict) -> None:
+        """Remember a successful result, evicting the least recently used entry."""
+        if "error" in result or not result.get("selections"):
+            return
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic(), result)
+            self._cache.move_to_end(key)
+            if len(self._cache) > SELECTION_CACHE_SIZE:
+                self._cache.popitem(last=False)
+    
+    def _prepare_prompt(
+        self,
+        num_selections: int,
+        exclude: AbstractSet[str]
+    ) -> Optional[str]:
+        """Build the selection prompt, or return None if no clips are available."""
+        # Get available clips (excluding already used ones)
+        available = [c for c in self.manifest.clips if c.filename not in exclude]
         
-        # Parse the response
-        response_text = response.content[0].text
+        if not available:
+            return None
+        
+        # If we have too many clips, we need to be smart about which to show the LLM
+        # For now, simple approach: take a sample that includes variety
+        if len(available) > 50:
+            available = self._smart_sample(available, 50)
         
+        # Convert to the compact columnar selector format
+        available_context = self.manifest.get_selector_batch_columnar(available)
+        
+        return self.build_prompt(available_context, num_selections)
+    
+    def _parse_response(self, response_text: str) -> dict:
+        """Parse the LLM response and drop selections missing from the manifest."""
         # Extract JSON from response (handle potential markdown wrapping)
         try:
             # Try direct parse first
-            result = json.loads(response_text)
+            result = _loads(response_text)
         except json.JSONDecodeError:
-            # Try to find JSON in the response
-            import re
-            json_match = re.search(r'\{[\s\S]*\}', response_text)
-            if json_match:
-                result = json.loads(json_match.group())
-            else:
+            # Fall back to the first balanced object in the response
+            json_text = _extract_json(response_text)
+            try:
+                result = _loads(json_text) if json_text else None
+            except json.JSONDecodeError:
+                result = None
+            if not isinstance(result, dict):
                 return {"error": "Failed to parse LLM response", "raw": response_text, "selections": []}
         
         # Validate selections exist in manifest
@@ -204,21 +439,25 @@ Return ONLY valid JSON in this exact format:
         result["selections"] = valid_selections
         return result
     
-    def _smart_sample(self, clips: list[Clip], n: int) -> list[dict]:
+    @staticmethod
+    def _motion_bucket(motion_intensity: str) -> str:
+        """Map a clip's motion intensity to a sampling bucket (default medium)."""
+        motion = motion_intensity.lower()
+        return motion if motion in ("low", "medium", "high") else "medium"
+    
+    def _smart_sample(self, clips: list[Clip], n: int) -> list[Clip]:
         """
         Sample clips intelligently to show variety to the LLM.
         Tries to include diverse moods, tags, and motion levels.
         """
         import random
         
-        # Group by motion intensity
+        # Group by motion intensity (precomputed buckets; unknown clips fall back)
         by_motion = {"low": [], "medium": [], "high": []}
+        motion_group = self._motion_group
         for c in clips:
-            motion = c.motion_intensity.lower()
-            if motion in by_motion:
-                by_motion[motion].append(c)
-            else:
-                by_motion["medium"].append(c)
+            group = motion_group.get(c.filename) or self._motion_bucket(c.motion_intensity)
+            by_motion[group].append(c)
         
         # Take proportionally from each
         result = []
@@ -231,37 +470,25 @@ Return ONLY valid JSON in this exact format:
         # Fill remaining slots randomly
         remaining = n - len(result)
         if remaining > 0:
-            unused = [c for c in clips if c not in result]
+            chosen = {c.filename for c in result}
+            unused = [c for c in clips if c.filename not in chosen]
             result.extend(random.sample(unused, min(remaining, len(unused))))
         
-        return [c.to_selector_context() for c in result]
+        return result
     
     def process_feedback(self, feedback: str) -> None:
         """Process user feedback and update state."""
         self.state.add_feedback(feedback)
         
-        # Simple keyword detection for direction changes
+        # Simple keyword detection for direction changes: one scan of the
+        # feedback, earliest-listed keyword wins when several appear
         feedback_lower = feedback.lower()
-        
-        direction_keywords = {
-            "darker": "exploring darker themes",
-            "lighter": "moving toward lighter, brighter content",
-            "faster": "increasing energy and pace",
-            "slower": "slowing down, contemplative",
-            "abstract": "embracing abstraction and surrealism",
-            "narrative": "building toward clearer narrative",
-            "emotional": "focusing on emotional resonance",
-            "violent": "exploring conflict and tension",
-            "peaceful": "seeking calm and serenity",
-            "weird": "leaning into the strange and surreal",
-            "funny": "looking for humor and levity",
-        }
-        
-        for keyword, direction in direction_keywords.items():
-            if keyword in feedback_lower:
-                self.state.direction = direction
-                print(f"Direction updated: {direction}")
-                break
+        hits = {m.group() for m in _DIRECTION_PATTERN.finditer(feedback_lower)}
+        if hits:
+            keyword = min(hits, key=_DIRECTION_PRIORITY.__getitem__)
+            direction = DIRECTION_KEYWORDS[keyword]
+            self.state.direction = direction
+            print(f"Direction updated: {direction}")
     
     def mark_played(self, filename: str) -> None:
         """Mark a clip as played."""
@@ -332,11 +559,8 @@ if __name__ == "__main__":
             n = int(arg) if arg else 3
             print(f"\nSelecting {n} clips...")
             
-            # Exclude recently played and queued
-            exclude = [p["filename"] for p in selector.state.recently_played]
-            exclude.extend(selector.state.current_queue)
-            
-            result = selector.select(n, exclude)
+            # Exclude recently played and queued (maintained incrementally)
+            result = selector.select(n, selector.state.exclude_set)
             
             if "error" in result:
                 print(f"Error: {result['error']}")
@@ -375,7 +599,7 @@ if __name__ == "__main__":
         
         elif action == "state":
             print("\nCurrent State:")
-            print(json.dumps(selector.state.to_context(), indent=2))
+            print(_dumps(selector.state.to_context(), indent=True))
         
         else:
             print(f"Unknown command: {action}")
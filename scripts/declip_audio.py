@@ -6,125 +6,198 @@ Attempts to reconstruct clipped waveforms using interpolation.
 
 import numpy as np
 from scipy import signal
-from scipy.interpolate import CubicSpline
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import subprocess
 import sys
-import os
 
-def extract_audio(video_path, output_wav):
-    """Extract audio to WAV for processing."""
-    subprocess.run([
-        'ffmpeg', '-y', '-i', video_path,
-        '-vn', '-acodec', 'pcm_f32le', '-ar', '48000', '-ac', '2',
-        output_wav
-    ], check=True, capture_output=True)
+# Block size for the filter stages, and the overlap on each side that lets
+# the zero-phase IIR filters settle before the kept part of a block
+BLOCK_SAMPLES = 1 << 20
+BLOCK_MARGIN = 8192
+
+# Clipped runs up to this long are bridged from their 4 nearest samples instead of a fit
+SHORT_CLIP_SAMPLES = 4
 
-def read_wav(path):
-    """Read WAV file using ffmpeg (avoids dependency on soundfile)."""
+def read_audio(video_path, sample_rate=48000):
+    """Decode a file's audio track straight to stereo float32 via an ffmpeg pipe."""
     result = subprocess.run([
-        'ffmpeg', '-i', path, '-f', 'f32le', '-acodec', 'pcm_f32le', '-'
+        'ffmpeg', '-i', video_path,
+        '-vn', '-f', 'f32le', '-acodec', 'pcm_f32le', '-ar', str(sample_rate), '-ac', '2',
+        'pipe:1'
     ], capture_output=True, check=True)
     audio = np.frombuffer(result.stdout, dtype=np.float32)
     # Reshape to stereo
     return audio.reshape(-1, 2)
 
-def write_wav(path, audio, sample_rate=48000):
-    """Write audio back to WAV."""
-    audio_bytes = audio.astype(np.float32).tobytes()
+def mux_audio(video_path, audio, output_path, sample_rate=48000):
+    """Mux processed audio (piped as raw float32) with the original video stream."""
+    pcm = np.ascontiguousarray(audio, dtype=np.float32)
     subprocess.run([
         'ffmpeg', '-y',
+        '-i', video_path,
         '-f', 'f32le', '-ar', str(sample_rate), '-ac', '2', '-i', 'pipe:0',
-        '-acodec', 'pcm_f32le', path
-    ], input=audio_bytes, check=True, capture_output=True)
-
-def detect_clipped_regions(audio, threshold=0.98, min_samples=2):
-    """Find regions where audio is clipped."""
-    clipped = np.abs(audio) >= threshold
-    regions = []
-
-    in_clip = False
-    start = 0
+        '-map', '0:v', '-map', '1:a',
+        '-c:v', 'copy', '-c:a', 'aac', '-b:a', '256k',
+        output_path
+    ], input=memoryview(pcm).cast('B'), check=True, capture_output=True)
 
-    for i in range(len(clipped)):
-        if clipped[i] and not in_clip:
-            start = i
-            in_clip = True
-        elif not clipped[i] and in_clip:
-            if i - start >= min_samples:
-                regions.append((start, i))
-            in_clip = False
+def detect_clipped_regions(audio, threshold=0.98, min_samples=2, clipped=None):
+    """
+    Find regions where audio is clipped.
+    clipped may pass a precomputed np.abs(audio) >= threshold mask.
+    """
+    if clipped is None:
+        clipped = np.abs(audio) >= threshold
 
-    if in_clip and len(audio) - start >= min_samples:
-        regions.append((start, len(audio)))
+    # Rising/falling edges of the padded mask mark region starts/ends
+    padded = np.zeros(len(clipped) + 2, dtype=np.int8)
+    padded[1:-1] = clipped
+    edges = np.diff(padded)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
 
-    return regions
+    keep = ends - starts >= min_samples
+    return list(zip(starts[keep].tolist(), ends[keep].tolist()))
 
 def cubic_declip(audio, threshold=0.98, extend=5):
     """
-    Reconstruct clipped regions using cubic spline interpolation.
+    Reconstruct clipped regions using a local cubic fit.
     Uses samples before and after the clip to estimate the true peak.
+    Accepts mono (N,) or multichannel (N, C) audio; channels run in parallel.
     """
     output = audio.copy()
-    regions = detect_clipped_regions(audio, threshold)
+    # One threshold pass over all channels, shared by the per-channel scans
+    clipped = np.abs(audio) >= threshold
+    if audio.ndim == 1:
+        counts = [_declip_channel(audio, output, clipped, extend)]
+    else:
+        channels = range(audio.shape[1])
+        with ThreadPoolExecutor(max_workers=len(channels)) as pool:
+            counts = list(pool.map(
+                lambda ch: _declip_channel(audio[:, ch], output[:, ch], clipped[:, ch], extend),
+                channels
+            ))
+
+    for count in counts:
+        print(f"  Found {count} clipped regions")
 
-    print(f"  Found {len(regions)} clipped regions")
+    return output
 
+def _declip_channel(audio, output, clipped, extend):
+    """Declip one channel into output (a view); returns the region count."""
+    regions = detect_clipped_regions(audio, clipped=clipped)
+    n = len(audio)
+
+    # Longer runs with a full window on both sides share a least-squares basis
+    # per clip length, so each length is fitted for all its regions in one
+    # solve. Short runs, and runs whose window is cut by the buffer edge, are
+    # bridged in closed form from the two samples either side.
+    by_length = {}
+    bridge_by_length = {}
     for start, end in regions:
-        # Extend the interpolation window
-        interp_start = max(0, start - extend)
-        interp_end = min(len(audio), end + extend)
+        if start < 2 or end + 2 > n:
+            continue  # fewer than two known samples on one side
 
-        # Get unclipped samples for interpolation
-        x_before = np.arange(interp_start, start)
-        x_after = np.arange(end, interp_end)
+        length = end - start
+        if length > SHORT_CLIP_SAMPLES and start - extend >= 0 and end + extend <= n and extend >= 2:
+            by_length.setdefault(length, []).append(start)
+        else:
+            bridge_by_length.setdefault(length, []).append(start)
 
-        if len(x_before) < 2 or len(x_after) < 2:
-            continue
+    for length, starts in by_length.items():
+        offsets = np.concatenate([np.arange(-extend, 0), np.arange(length, length + extend)])
+        starts = np.asarray(starts)[:, None]
 
-        x_known = np.concatenate([x_before, x_after])
-        y_known = np.concatenate([audio[x_before], audio[x_after]])
+        # (2*extend, 4) cubic basis vs. (2*extend, R) known samples
+        known = audio[starts + offsets].T
+        coeffs, *_ = np.linalg.lstsq(np.vander(offsets, 4), known, rcond=None)
 
-        try:
-            # Fit cubic spline through unclipped samples
-            cs = CubicSpline(x_known, y_known)
+        # Reconstruct every clipped region of this length at once
+        gap = np.arange(length)
+        output[starts + gap] = (np.vander(gap, 4) @ coeffs).T
 
-            # Reconstruct the clipped region
-            x_clipped = np.arange(start, end)
-            output[start:end] = cs(x_clipped)
-        except Exception:
-            pass
+    for length, starts in bridge_by_length.items():
+        _hermite_bridge(audio, output, np.asarray(starts), length)
 
-    return output
+    return len(regions)
+
+def _hermite_bridge(audio, output, starts, length):
+    """
+    Bridge clipped runs of one length with a 4-point cubic Hermite segment.
+
+    The segment runs from the last sample before the run (p1) to the first
+    after it (p2). Tangents are the slopes just outside the run (p0->p1 and
+    p2->p3), which carry the waveform up into the lost peak; central
+    (Catmull-Rom) tangents straddle the peak and flatten it.
+    """
+    starts = starts[:, None]
+    p0 = audio[starts - 2]
+    p1 = audio[starts - 1]
+    p2 = audio[starts + length]
+    p3 = audio[starts + length + 1]
+
+    # Slopes per sample, rescaled to the segment's length + 1 sample span
+    span = length + 1
+    m1 = (p1 - p0) * span
+    m2 = (p3 - p2) * span
+
+    # Hermite basis at the clipped sample positions
+    t = np.arange(1, span) / span
+    t2 = t * t
+    t3 = t2 * t
+    h00 = 2 * t3 - 3 * t2 + 1
+    h10 = t3 - 2 * t2 + t
+    h01 = -2 * t3 + 3 * t2
+    h11 = t3 - t2
+
+    output[starts + np.arange(length)] = h00 * p1 + h10 * m1 + h01 * p2 + h11 * m2
+
+@lru_cache(maxsize=8)
+def filter_bank(sr):
+    """Butterworth designs (second-order sections) for the chain, per sample rate."""
+    nyquist = sr / 2
+    return {
+        'low': signal.butter(4, 200 / nyquist, btype='low', output='sos'),
+        'high': signal.butter(4, 4000 / nyquist, btype='high', output='sos'),
+        'exciter': signal.butter(2, 3000 / nyquist, btype='high', output='sos'),
+        'harsh': signal.butter(2, [2000 / nyquist, 5000 / nyquist], btype='band', output='sos'),
+    }
+
+def zero_phase(sos, audio):
+    """sosfiltfilt along time; filter state stays float64, output comes back float32."""
+    return signal.sosfiltfilt(sos, audio, axis=0).astype(np.float32, copy=False)
 
 def soft_clip_tanh(audio, drive=2.0):
     """Apply soft saturation using tanh - rounds off harsh edges."""
-    return np.tanh(audio * drive) / np.tanh(drive)
+    out = audio * drive
+    np.tanh(out, out=out)
+    out /= np.tanh(drive)
+    return out
 
 def multiband_compress(audio, sr=48000):
     """
     3-band compression targeting different frequency ranges.
     Aggressive settings for heavily clipped audio.
     """
-    # Design crossover filters
-    low_cutoff = 200 / (sr/2)
-    high_cutoff = 4000 / (sr/2)
-
-    # Butterworth filters
-    b_low, a_low = signal.butter(4, low_cutoff, btype='low')
-    b_mid, a_mid = signal.butter(4, [low_cutoff, high_cutoff], btype='band')
-    b_high, a_high = signal.butter(4, high_cutoff, btype='high')
+    # Crossover filters at 200 Hz and 4 kHz
+    filters = filter_bank(sr)
 
-    # Split into bands
-    low = signal.filtfilt(b_low, a_low, audio, axis=0)
-    mid = signal.filtfilt(b_mid, a_mid, audio, axis=0)
-    high = signal.filtfilt(b_high, a_high, audio, axis=0)
+    # Split into bands; mid is the residual, so the bands sum back to the input.
+    # The two filter passes run concurrently (SciPy's sosfilt releases the GIL)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        low, high = pool.map(lambda sos: zero_phase(sos, audio), (filters['low'], filters['high']))
+    mid = audio - low - high
 
     # Compress each band (simple soft knee compression)
     def compress(x, threshold, ratio):
-        mask = np.abs(x) > threshold
-        compressed = x.copy()
-        compressed[mask] = np.sign(x[mask]) * (threshold + (np.abs(x[mask]) - threshold) / ratio)
-        return compressed
+        # Branchless: min(|x|, t) + max(|x| - t, 0) / ratio, with the sign of x
+        ax = np.abs(x)
+        over = np.maximum(ax - threshold, 0.0)
+        over /= ratio
+        np.minimum(ax, threshold, out=ax)
+        ax += over
+        return np.copysign(ax, x, out=ax)
 
     # Aggressive compression on low/mid (where drums live)
     low_compressed = compress(low, 0.2, 8.0)
@@ -137,13 +210,16 @@ def multiband_compress(audio, sr=48000):
 def harmonic_exciter(audio, sr=48000):
     """Add back some harmonics that were lost in clipping (subtle)."""
     # Generate harmonics through soft saturation
-    harmonics = np.tanh(audio * 3) - audio
+    harmonics = audio * 3
+    np.tanh(harmonics, out=harmonics)
+    harmonics -= audio
 
     # High-pass the harmonics (we only want the sparkle)
-    b, a = signal.butter(2, 3000 / (sr/2), btype='high')
-    harmonics = signal.filtfilt(b, a, harmonics, axis=0)
+    harmonics = zero_phase(filter_bank(sr)['exciter'], harmonics)
 
-    return audio + harmonics * 0.1
+    harmonics *= 0.1
+    harmonics += audio
+    return harmonics
 
 def de_harsh(audio, sr=48000):
     """
@@ -152,41 +228,51 @@ def de_harsh(audio, sr=48000):
     """
     # Notch out some of the harsh frequencies (2-5kHz range)
     # Use a gentle shelf instead of harsh notches
-    b, a = signal.butter(2, [2000 / (sr/2), 5000 / (sr/2)], btype='band')
-    harsh = signal.filtfilt(b, a, audio, axis=0)
+    harsh = zero_phase(filter_bank(sr)['harsh'], audio)
 
     # Subtract some of the harsh content
     return audio - harsh * 0.3
 
 def normalize(audio, target_peak=0.9):
-    """Normalize to target peak level."""
-    peak = np.max(np.abs(audio))
+    """Normalize to target peak level (in place)."""
+    peak = max(audio.max(initial=0.0), -audio.min(initial=0.0))
     if peak > 0:
-        return audio * (target_peak / peak)
+        audio *= target_peak / peak
     return audio
 
-def process_full_chain(audio, sr=48000):
-    """Full aggressive restoration chain."""
-    print("Step 1: Cubic spline declipping...")
-    audio = cubic_declip(audio[:, 0]), cubic_declip(audio[:, 1])
-    audio = np.column_stack(audio)
-
-    print("Step 2: Multiband compression...")
+def _filter_chain(audio, sr):
+    """Steps 2-5 of the chain on one block."""
     audio = multiband_compress(audio, sr)
-
-    print("Step 3: De-harshening...")
     audio = de_harsh(audio, sr)
-
-    print("Step 4: Soft saturation pass...")
     audio = soft_clip_tanh(audio, drive=1.5)
+    return harmonic_exciter(audio, sr)
 
-    print("Step 5: Harmonic exciter...")
-    audio = harmonic_exciter(audio, sr)
+def process_full_chain(audio, sr=48000):
+    """
+    Full aggressive restoration chain.
+    Filter stages run block by block (with overlap) into one float32 output,
+    so only a block's worth of intermediates is alive at a time.
+    """
+    # Work in float32 throughout; every stage preserves the dtype
+    audio = audio.astype(np.float32, copy=False)
+
+    print("Step 1: Cubic declipping...")
+    audio = cubic_declip(audio)
+
+    n = len(audio)
+    num_blocks = max(1, -(-n // BLOCK_SAMPLES))
+    print(f"Steps 2-5: Multiband compression, de-harshening, soft saturation, "
+          f"harmonic exciter ({num_blocks} block{'s' if num_blocks != 1 else ''})...")
+    output = np.empty(audio.shape, dtype=np.float32)
+    for start in range(0, n, BLOCK_SAMPLES):
+        end = min(start + BLOCK_SAMPLES, n)
+        lo = max(0, start - BLOCK_MARGIN)
+        hi = min(n, end + BLOCK_MARGIN)
+        block = _filter_chain(audio[lo:hi], sr)
+        output[start:end] = block[start - lo:end - lo]
 
     print("Step 6: Final normalization...")
-    audio = normalize(audio, 0.85)
-
-    return audio
+    return normalize(output, 0.85)
 
 def main():
     if len(sys.argv) < 3:
@@ -196,17 +282,11 @@ def main():
     input_path = sys.argv[1]
     output_path = sys.argv[2]
 
-    temp_wav = '/tmp/declip_temp.wav'
-    processed_wav = '/tmp/declip_processed.wav'
-
     print(f"Processing: {input_path}")
     print()
 
-    print("Extracting audio...")
-    extract_audio(input_path, temp_wav)
-
-    print("Reading audio data...")
-    audio = read_wav(temp_wav)
+    print("Decoding audio...")
+    audio = read_audio(input_path)
     print(f"  Shape: {audio.shape}, Duration: {len(audio)/48000:.1f}s")
     print(f"  Input peak: {np.max(np.abs(audio)):.3f}")
 
@@ -216,22 +296,8 @@ def main():
     print(f"  Output peak: {np.max(np.abs(processed)):.3f}")
 
     print()
-    print("Writing processed audio...")
-    write_wav(processed_wav, processed)
-
     print("Muxing with original video...")
-    subprocess.run([
-        'ffmpeg', '-y',
-        '-i', input_path,
-        '-i', processed_wav,
-        '-map', '0:v', '-map', '1:a',
-        '-c:v', 'copy', '-c:a', 'aac', '-b:a', '256k',
-        output_path
-    ], check=True, capture_output=True)
-
-    # Cleanup
-    os.remove(temp_wav)
-    os.remove(processed_wav)
+    mux_audio(input_path, processed, output_path)
 
     print()
     print(f"Done! Output: {output_path}")
@@ -14,6 +14,7 @@ Usage:
 import cv2
 import numpy as np
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dataclasses import dataclass
 from typing import Optional, List, Dict, Any, Tuple
@@ -24,7 +25,7 @@ class ObjectFeatures:
     """Features extracted from a detected object."""
     contour: np.ndarray
     centroid: Tuple[float, float]  # Normalized (0-1) coordinates
-    centroid_raw: Tuple[int, int]  # Raw pixel coordinates in ROI
+    centroid_raw: Tuple[int, int]  # Raw pixel coordinates in ROI (full resolution)
     area: float  # Contour area in pixels
     area_normalized: float  # Area as fraction of ROI
     circularity: float  # How circular (0-1, 1=perfect circle)
@@ -64,6 +65,21 @@ def compute_hsv_histogram(image: np.ndarray, mask: np.ndarray) -> np.ndarray:
     return hist
 
 
+def component_contour(labels: np.ndarray, stats: np.ndarray, label: int) -> np.ndarray:
+    """
+    Trace the outer contour of one connected component.
+
+    Only the component's bounding box is scanned; the contour comes back in
+    full-image coordinates.
+    """
+    x, y, w, h = stats[label, :4]
+    component = (labels[y:y + h, x:x + w] == label).astype(np.uint8)
+    contours, _ = cv2.findContours(
+        component, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(int(x), int(y))
+    )
+    return contours[0]
+
+
 def extract_object_features(
     image_path: str,
     roi_bounds: Tuple[float, float, float, float] = (0.05, 0.55, 0.15, 0.55),
@@ -99,29 +115,30 @@ def extract_object_features(
     # Convert to grayscale
     gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
 
-    # Adaptive threshold based on max brightness
+    # Adaptive threshold based on max brightness. Any non-black ROI has pixels
+    # above 70% of its max, so a single threshold always suffices.
     max_val = gray.max()
-    threshold = max_val * 0.7
-    _, binary = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
-
-    # Find contours
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if max_val == 0:
+        print(f"Warning: No bright regions found in {image_path}")
+        return None
+    _, binary = cv2.threshold(gray, max_val * 0.7, 255, cv2.THRESH_BINARY)
 
-    # Try lower threshold if needed
-    if not contours:
-        threshold = max_val * 0.5
-        _, binary = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
-        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Label bright regions; area/bbox for every region come from one C pass
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
 
-    if not contours:
+    if num_labels <= 1:
         print(f"Warning: No bright regions found in {image_path}")
         return None
 
-    # Find the best contour (circular + large)
+    # Find the best contour (circular + large). Pixel area bounds contour area
+    # from above, so only regions passing min_area on pixels get traced.
+    pixel_areas = stats[:, cv2.CC_STAT_AREA]
+    candidates = np.flatnonzero(pixel_areas[1:] >= min_area) + 1
     best_contour = None
     best_score = 0
 
-    for contour in contours:
+    for label in candidates:
+        contour = component_contour(labels, stats, label)
         area = cv2.contourArea(contour)
         if area < min_area:
             continue
@@ -139,8 +156,9 @@ def extract_object_features(
             best_contour = contour
 
     if best_contour is None:
-        # Fallback: largest contour
-        best_contour = max(contours, key=cv2.contourArea)
+        # Fallback: largest region
+        largest = int(np.argmax(pixel_areas[1:])) + 1
+        best_contour = component_contour(labels, stats, largest)
 
     # Get centroid
     M = cv2.moments(best_contour)
@@ -166,8 +184,12 @@ def extract_object_features(
     mask = np.zeros((roi_h, roi_w), dtype=np.uint8)
     cv2.drawContours(mask, [best_contour], -1, 255, -1)
 
-    # Compute color histogram
-    color_histogram = compute_hsv_histogram(roi, mask)
+    # Compute color histogram over the object's bounding box only; pixels
+    # outside it are masked out anyway
+    bx, by, bw, bh = cv2.boundingRect(best_contour)
+    color_histogram = compute_hsv_histogram(
+        roi[by:by + bh, bx:bx + bw], mask[by:by + bh, bx:bx + bw]
+    )
 
     return ObjectFeatures(
         contour=best_contour,
@@ -299,9 +321,12 @@ def grade_edit_point(
     if weight_sum > 0:
         active_weights = {k: v / weight_sum for k, v in active_weights.items()}
 
-    # Extract features from both frames
-    features_a = extract_object_features(frame_a_path)
-    features_b = extract_object_features(frame_b_path)
+    # Extract features from both frames concurrently (OpenCV releases the GIL)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        future_a = pool.submit(extract_object_features, frame_a_path)
+        future_b = pool.submit(extract_object_features, frame_b_path)
+        features_a = future_a.result()
+        features_b = future_b.result()
 
     if features_a is None or features_b is None:
         return {
@@ -4,8 +4,14 @@ Add names and descriptions to all detected characters.
 """
 
 import json
+import os
 from pathlib import Path
 
+try:
+    import orjson  # optional: faster load/save of the characters database
+except ImportError:
+    orjson = None
+
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 CHARS_JSON = PROJECT_ROOT / "docs" / "clip-metadata" / "characters.json"
 
@@ -238,22 +244,38 @@ CHARACTER_METADATA = {
     }
 }
 
+METADATA_FIELDS = ("name", "description", "tags")
+
 def main():
     # Load current characters
-    with open(CHARS_JSON) as f:
-        data = json.load(f)
+    old_bytes = CHARS_JSON.read_bytes()
+    data = orjson.loads(old_bytes) if orjson is not None else json.loads(old_bytes)
 
     updated = 0
     for char_id, metadata in CHARACTER_METADATA.items():
-        if char_id in data["characters"]:
-            data["characters"][char_id]["name"] = metadata["name"]
-            data["characters"][char_id]["description"] = metadata["description"]
-            data["characters"][char_id]["tags"] = metadata["tags"]
-            updated += 1
+        char = data["characters"].get(char_id)
+        if char is None or all(char.get(k) == metadata[k] for k in METADATA_FIELDS):
+            continue
+        for k in METADATA_FIELDS:
+            char[k] = metadata[k]
+        updated += 1
+
+    # orjson's OPT_INDENT_2 output matches json.dump(indent=2) here
+    if orjson is not None:
+        new_bytes = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        new_bytes = json.dumps(data, indent=2).encode()
+
+    # Leave the file (and its mtime) alone on a no-op run
+    if new_bytes == old_bytes:
+        print(f"All characters already up to date, {CHARS_JSON} unchanged")
+        return
 
-    # Save updated file
-    with open(CHARS_JSON, "w") as f:
-        json.dump(data, f, indent=2)
+    # Write beside the original and swap it in, so a crash never leaves a
+    # truncated characters.json behind
+    tmp_path = CHARS_JSON.with_suffix(".json.tmp")
+    tmp_path.write_bytes(new_bytes)
+    os.replace(tmp_path, CHARS_JSON)
 
     print(f"Updated {updated} characters with names and descriptions")
     print(f"Saved to {CHARS_JSON}")
@@ -8,6 +8,9 @@ Usage:
 
     # With custom parameters:
     echo '{"faces": [...], "eps": 0.5, "min_samples": 2}' | python cluster_characters.py
+
+    # With embeddings in a .npy written by detect_faces.py (faces carry embedding_index):
+    echo '{"faces": [{"face_id": "f1", "embedding_index": 0}], "emb_file": "/tmp/emb.npy"}' | python cluster_characters.py
 """
 
 import sys
@@ -17,11 +20,42 @@ from typing import Optional
 import numpy as np
 from sklearn.cluster import DBSCAN
 
+try:
+    import ijson  # optional: stream large face lists instead of buffering all of stdin
+except ImportError:
+    ijson = None
+
+try:
+    import orjson  # optional: faster JSON encode/decode for embedding-heavy payloads
+except ImportError:
+    orjson = None
+
+# ijson's JSONError is not a ValueError, so catch it alongside json's
+JSON_ERRORS = (json.JSONDecodeError,) + ((ijson.JSONError,) if ijson is not None else ())
+
+# Events that finish a value at its own prefix (start_*/map_key only open one)
+_VALUE_END_EVENTS = {"end_map", "end_array", "null", "boolean", "integer", "double", "number", "string"}
+
+
+def _loads(data):
+    """Parse JSON text or bytes, preferring orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps(obj) -> str:
+    """Serialize to compact JSON text, preferring orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(obj)
+
 
 def cluster_faces(
     faces: list[dict],
     eps: float = 0.5,
-    min_samples: int = 2
+    min_samples: int = 2,
+    embeddings: Optional[np.ndarray] = None
 ) -> dict:
     """
     Cluster face embeddings into character groups.
@@ -32,6 +66,8 @@ def cluster_faces(
              Lower = stricter matching, higher = more lenient
              0.5 is a good default for ~85% accuracy
         min_samples: Minimum faces to form a character cluster
+        embeddings: Optional (N, 128) matrix aligned with faces; when given,
+                    faces only need "face_id" (see read_input)
 
     Returns:
         {
@@ -52,10 +88,40 @@ def cluster_faces(
             }
         }
     """
-    if not faces:
+    # Extract embeddings and face_ids. Fill a preallocated float32 matrix row
+    # by row rather than boxing every value into one big nested list first.
+    face_ids = [f["face_id"] for f in faces]
+    if embeddings is None and faces:
+        embeddings = np.empty((len(faces), len(faces[0]["embedding"])), dtype=np.float32)
+        for i, f in enumerate(faces):
+            embeddings[i] = f["embedding"]
+
+    result = cluster_embeddings(face_ids, embeddings, eps=eps, min_samples=min_samples)
+    # Per-row ids are for in-process callers; keep the JSON output per character
+    del result["face_character_ids"]
+    return result
+
+
+def cluster_embeddings(
+    face_ids: list[str],
+    embeddings: np.ndarray,
+    eps: float = 0.5,
+    min_samples: int = 2
+) -> dict:
+    """
+    Cluster an (N, 128) embedding matrix whose rows belong to face_ids.
+
+    Same clustering and result as cluster_faces, for callers that already
+    hold the embeddings as a matrix and have no per-face dicts to build.
+    The result also carries "face_character_ids": each row's character_id
+    (None for noise), aligned with face_ids, so callers can assign
+    characters by position instead of mapping face_ids back.
+    """
+    if not face_ids:
         return {
             "characters": [],
             "unassigned": [],
+            "face_character_ids": [],
             "stats": {
                 "total_faces": 0,
                 "characters_found": 0,
@@ -64,35 +130,38 @@ def cluster_faces(
             }
         }
 
-    # Extract embeddings and face_ids
-    face_ids = [f["face_id"] for f in faces]
-    embeddings = np.array([f["embedding"] for f in faces])
-
     # Run DBSCAN clustering
     # DBSCAN labels: -1 = noise (unassigned), 0+ = cluster index
-    clustering = DBSCAN(eps=eps, min_samples=min_samples, metric="euclidean")
+    # At 128 dims the default brute-force radius search (chunked BLAS) beats
+    # ball/kd trees by ~10x; just spread its neighbour queries over all cores.
+    clustering = DBSCAN(eps=eps, min_samples=min_samples, metric="euclidean", n_jobs=-1)
     labels = clustering.fit_predict(embeddings)
 
-    # Group faces by cluster
-    clusters: dict[int, list[int]] = {}  # cluster_id -> list of indices
-    unassigned_indices: list[int] = []
-
-    for idx, label in enumerate(labels):
-        if label == -1:
-            unassigned_indices.append(idx)
-        else:
-            if label not in clusters:
-                clusters[label] = []
-            clusters[label].append(idx)
+    # Group faces by cluster: a stable argsort keeps each cluster's faces in
+    # input order, and the label boundaries split it into per-cluster indices
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    boundaries = np.flatnonzero(np.diff(sorted_labels)) + 1
+    group_labels = sorted_labels[np.concatenate(([0], boundaries))]
+    groups = np.split(order, boundaries)
 
-    # Build character objects
+    # Build character objects (noise, label -1, sorts first)
     characters = []
-    for cluster_id, indices in sorted(clusters.items()):
-        cluster_embeddings = embeddings[indices]
-        centroid = np.mean(cluster_embeddings, axis=0)
+    unassigned_indices: list[int] = []
+    face_character_ids: list[Optional[str]] = [None] * len(face_ids)
+    for cluster_id, indices in zip(group_labels.tolist(), groups):
+        if cluster_id == -1:
+            unassigned_indices = indices.tolist()
+            continue
+
+        centroid = np.mean(embeddings[indices], axis=0)
+        character_id = f"char_{cluster_id + 1:03d}"
+        indices = indices.tolist()
+        for i in indices:
+            face_character_ids[i] = character_id
 
         characters.append({
-            "character_id": f"char_{cluster_id + 1:03d}",
+            "character_id": character_id,
             "face_ids": [face_ids[i] for i in indices],
             "centroid": centroid.tolist(),
             "occurrence_count": len(indices)
@@ -103,8 +172,9 @@ def cluster_faces(
     return {
         "characters": characters,
         "unassigned": unassigned,
+        "face_character_ids": face_character_ids,
         "stats": {
-            "total_faces": len(faces),
+            "total_faces": len(face_ids),
             "characters_found": len(characters),
             "faces_assigned": len(face_ids) - len(unassigned),
             "faces_unassigned": len(unassigned)
@@ -115,7 +185,8 @@ def cluster_faces(
 def find_matching_character(
     embedding: list[float],
     characters: list[dict],
-    threshold: float = 0.5
+    threshold: float = 0.5,
+    centroids: Optional[np.ndarray] = None
 ) -> Optional[dict]:
     """
     Find which character a face embedding matches.
@@ -124,6 +195,8 @@ def find_matching_character(
         embedding: 128-dim face embedding
         characters: List of character dicts with "centroid" field
         threshold: Max distance to consider a match
+        centroids: Optional matrix from prepare_characters(characters); pass it
+                   when matching many embeddings against the same characters
 
     Returns:
         {"character_id": str, "distance": float} or None if no match
@@ -131,29 +204,121 @@ def find_matching_character(
     if not characters:
         return None
 
-    embedding_arr = np.array(embedding)
-    best_match = None
-    best_distance = float("inf")
+    if centroids is None:
+        centroids = prepare_characters(characters)
+    distances = np.linalg.norm(centroids - np.asarray(embedding, dtype=np.float64), axis=1)
+    best = int(distances.argmin())
+
+    if distances[best] < threshold:
+        return {
+            "character_id": characters[best]["character_id"],
+            "distance": float(distances[best])
+        }
+
+    return None
 
-    for char in characters:
-        centroid = np.array(char["centroid"])
-        distance = np.linalg.norm(embedding_arr - centroid)
 
-        if distance < threshold and distance < best_distance:
-            best_distance = distance
-            best_match = {
-                "character_id": char["character_id"],
-                "distance": float(distance)
-            }
+# (characters list, centroid matrix) for the last list matched against
+_centroid_cache: Optional[tuple[list[dict], np.ndarray]] = None
+
+
+def prepare_characters(characters: list[dict]) -> np.ndarray:
+    """
+    Stack the character centroids into a (C, 128) matrix for find_matching_character.
+
+    The matrix for the most recent list is cached, so repeated calls with the
+    same list are free; callers holding on to the result can skip even that.
+    """
+    global _centroid_cache
+    # Holding a reference to the list keeps the identity check safe from id reuse
+    if _centroid_cache is not None and _centroid_cache[0] is characters \
+            and len(_centroid_cache[1]) == len(characters):
+        return _centroid_cache[1]
+
+    centroids = np.array([char["centroid"] for char in characters], dtype=np.float64)
+    _centroid_cache = (characters, centroids)
+    return centroids
 
-    return best_match
+
+def read_input(stream) -> tuple[dict, Optional[np.ndarray]]:
+    """
+    Parse the JSON request from a binary stream.
+
+    With ijson available, faces are streamed one at a time and each embedding
+    goes straight into a float32 row, so the full list of Python floats is
+    never held in memory. The returned faces then carry everything except
+    "embedding", and the matrix is returned alongside. Without ijson the
+    whole request is parsed in one go and the matrix is None.
+    """
+    if ijson is None:
+        return _loads(stream.read()), None
+
+    input_data: dict = {}
+    rows: list[np.ndarray] = []
+    values: list[float] = []
+    key = target = builder = None
+
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        # Hot path: one number of a face embedding, collected without a builder
+        if prefix == "faces.item.embedding.item":
+            values.append(value)
+            continue
+        if prefix == "faces.item.embedding":
+            if event == "end_array":
+                rows.append(np.array(values, dtype=np.float32))
+            values = []
+            continue
+        if prefix == "":
+            if event == "map_key":
+                key = value
+                target = "faces.item" if key == "faces" else key
+            continue
+        if prefix == "faces" and key == "faces":
+            if event == "start_array":
+                input_data["faces"] = []
+            continue
+        if prefix == "faces.item" and event == "map_key" and value == "embedding":
+            continue
+
+        if builder is None:
+            builder = ijson.ObjectBuilder()
+        builder.event(event, value)
+        if prefix != target or event not in _VALUE_END_EVENTS:
+            continue
+
+        # One complete value: a single face, or any other top-level field
+        if target == "faces.item":
+            input_data["faces"].append(builder.value)
+        else:
+            input_data[key] = builder.value
+        builder = None
+
+    faces = input_data.get("faces")
+    if not rows or not isinstance(faces, list) or len(rows) != len(faces):
+        return input_data, None
+    return input_data, np.stack(rows)
+
+
+def load_embedding_file(emb_file: str, faces: list[dict]) -> np.ndarray:
+    """
+    Memory-map an (N, 128) .npy of embeddings and line it up with faces.
+
+    Faces with an "embedding_index" (as written by detect_faces.py) select
+    their rows; otherwise row i belongs to faces[i].
+    """
+    matrix = np.load(emb_file, mmap_mode="r")
+    if faces and "embedding_index" in faces[0]:
+        return matrix[[f["embedding_index"] for f in faces]]
+    if len(matrix) != len(faces):
+        raise ValueError(f"{emb_file} has {len(matrix)} rows for {len(faces)} faces")
+    return matrix
 
 
 def main():
     # Read JSON from stdin
     try:
-        input_data = json.load(sys.stdin)
-    except json.JSONDecodeError as e:
+        input_data, embeddings = read_input(sys.stdin.buffer)
+    except JSON_ERRORS as e:
         print(json.dumps({"error": f"Invalid JSON input: {e}"}), file=sys.stdout)
         sys.exit(1)
 
@@ -174,14 +339,22 @@ def main():
         threshold = input_data["find_match"].get("threshold", 0.5)
 
         match = find_matching_character(embedding, characters, threshold)
-        print(json.dumps({"match": match}))
+        print(_dumps({"match": match}))
         return
 
+    # Embeddings handed over as a float32 .npy instead of JSON lists
+    if input_data.get("emb_file"):
+        try:
+            embeddings = load_embedding_file(input_data["emb_file"], faces)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            print(json.dumps({"error": f"Could not load emb_file: {e}"}), file=sys.stdout)
+            sys.exit(1)
+
     # Cluster faces
-    output = cluster_faces(faces, eps=eps, min_samples=min_samples)
+    output = cluster_faces(faces, eps=eps, min_samples=min_samples, embeddings=embeddings)
 
     # Write JSON to stdout
-    print(json.dumps(output))
+    print(_dumps(output))
 
 
 if __name__ == "__main__":
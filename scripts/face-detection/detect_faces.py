@@ -8,16 +8,59 @@ Usage:
 
     # Or with a file:
     python detect_faces.py < input.json
+
+    # Persistent mode: one JSON request per line in, one JSON response per line out
+    python detect_faces.py --serve
+
+    # Write embeddings to a float32 .npy instead of inline JSON lists
+    echo '{"frames": [...], "emb_file": "/tmp/emb.npy"}' | python detect_faces.py
 """
 
 import sys
 import json
 import os
+import multiprocessing as mp
 from typing import Optional
 
+import dlib
 import face_recognition
 import numpy as np
 
+try:
+    import orjson  # optional: faster encoding of the embedding-heavy output
+except ImportError:
+    orjson = None
+
+try:
+    import cv2  # optional: libjpeg-turbo/libpng decode, faster than PIL
+except ImportError:
+    cv2 = None
+
+# dlib built with CUDA runs the CNN detector on the GPU; batch frames through
+# it instead of running HOG per image on the CPU.
+USE_CUDA = bool(getattr(dlib, "DLIB_USE_CUDA", False))
+
+# Frames per GPU batch - lower this if the card runs out of VRAM.
+CNN_BATCH_SIZE = 32
+
+# HOG runs on a copy no larger than this on its long side; cost scales with
+# pixel count. Embeddings are still computed on the full-resolution frame.
+HOG_MAX_DIM = 720
+
+
+def _loads(data):
+    """Parse JSON text or bytes, preferring orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps(obj) -> str:
+    """Serialize to compact JSON text, preferring orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(obj)
+
 
 def detect_faces_in_image(image_path: str) -> dict:
     """
@@ -48,30 +91,17 @@ def detect_faces_in_image(image_path: str) -> dict:
 
     try:
         # Load image
-        image = face_recognition.load_image_file(image_path)
+        image = load_image(image_path)
 
         # Detect face locations using HOG model (faster than CNN, good enough for ~85% accuracy)
         # Returns list of (top, right, bottom, left) tuples
-        face_locations = face_recognition.face_locations(image, model="hog")
+        face_locations = hog_face_locations(image)
 
         if not face_locations:
             # No faces found - not an error, just empty result
             return result
 
-        # Get face encodings (128-dim embeddings) for each detected face
-        face_encodings = face_recognition.face_encodings(image, face_locations)
-
-        for location, encoding in zip(face_locations, face_encodings):
-            top, right, bottom, left = location
-            result["faces"].append({
-                "location": {
-                    "top": int(top),
-                    "right": int(right),
-                    "bottom": int(bottom),
-                    "left": int(left)
-                },
-                "embedding": encoding.tolist()  # Convert numpy array to list
-            })
+        add_face_encodings(result, image, face_locations)
 
     except Exception as e:
         result["error"] = str(e)
@@ -79,16 +109,108 @@ def detect_faces_in_image(image_path: str) -> dict:
     return result
 
 
+def hog_face_locations(image: np.ndarray) -> list[tuple[int, int, int, int]]:
+    """Run HOG detection on a copy downscaled to HOG_MAX_DIM, in full-res coordinates."""
+    height, width = image.shape[:2]
+    scale = HOG_MAX_DIM / max(height, width)
+    if scale >= 1 or cv2 is None:
+        return face_recognition.face_locations(image, model="hog")
+
+    small = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    return [
+        (
+            max(0, round(top / scale)),
+            min(width, round(right / scale)),
+            min(height, round(bottom / scale)),
+            max(0, round(left / scale))
+        )
+        for top, right, bottom, left in face_recognition.face_locations(small, model="hog")
+    ]
+
+
+def load_image(image_path: str) -> np.ndarray:
+    """Decode an image to the uint8 RGB array face_recognition expects."""
+    if cv2 is not None:
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if image is not None:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    # No OpenCV, or a format it can't read - PIL also gives the proper error
+    return face_recognition.load_image_file(image_path)
+
+
+def add_face_encodings(result: dict, image: np.ndarray, face_locations: list) -> None:
+    """Compute 128-dim embeddings for the located faces and append them to result."""
+    face_encodings = face_recognition.face_encodings(image, face_locations)
+
+    for location, encoding in zip(face_locations, face_encodings):
+        top, right, bottom, left = location
+        result["faces"].append({
+            "location": {
+                "top": int(top),
+                "right": int(right),
+                "bottom": int(bottom),
+                "left": int(left)
+            },
+            "embedding": encoding.tolist()  # Convert numpy array to list
+        })
+
+
+def batch_detect(image_paths: list[str]) -> list[dict]:
+    """
+    Detect faces with dlib's CNN model on the GPU, CNN_BATCH_SIZE frames at a time.
+
+    Returns one result per path, in input order, shaped like detect_faces_in_image.
+    """
+    results = [{"frame_path": p, "faces": [], "error": None} for p in image_paths]
+
+    for start in range(0, len(image_paths), CNN_BATCH_SIZE):
+        # batch_face_locations needs equally sized images, so group by shape
+        by_shape: dict[tuple, list[tuple[int, np.ndarray]]] = {}
+        for i in range(start, min(start + CNN_BATCH_SIZE, len(image_paths))):
+            if not os.path.exists(image_paths[i]):
+                results[i]["error"] = f"File not found: {image_paths[i]}"
+                continue
+            try:
+                image = load_image(image_paths[i])
+            except Exception as e:
+                results[i]["error"] = str(e)
+                continue
+            by_shape.setdefault(image.shape, []).append((i, image))
+
+        for group in by_shape.values():
+            images = [image for _, image in group]
+            try:
+                batch_locations = face_recognition.batch_face_locations(
+                    images, number_of_times_to_upsample=0, batch_size=len(images)
+                )
+            except Exception as e:
+                for i, _ in group:
+                    results[i]["error"] = str(e)
+                continue
+
+            for (i, image), face_locations in zip(group, batch_locations):
+                if not face_locations:
+                    continue
+                try:
+                    add_face_encodings(results[i], image, face_locations)
+                except Exception as e:
+                    results[i]["error"] = str(e)
+
+    return results
+
+
 def process_batch(input_data: dict) -> dict:
     """
     Process a batch of frames.
 
     Input:
-        {"frames": ["/path/to/frame1.png", "/path/to/frame2.png", ...]}
+        {"frames": ["/path/to/frame1.png", "/path/to/frame2.png", ...],
+         "emb_file": "/path/to/embeddings.npy"}  # optional
 
     Output:
         {
             "results": [...],
+            "emb_file": str,  # only when requested, see save_embeddings
             "stats": {
                 "frames_processed": int,
                 "faces_detected": int,
@@ -97,20 +219,28 @@ def process_batch(input_data: dict) -> dict:
         }
     """
     frames = input_data.get("frames", [])
-    results = []
     total_faces = 0
     error_count = 0
 
-    for frame_path in frames:
-        result = detect_faces_in_image(frame_path)
-        results.append(result)
+    # Each frame is an independent HOG + embedding pass, so fan out across
+    # cores. Ordered imap keeps results aligned with the input frames.
+    if USE_CUDA:
+        results = batch_detect(frames)
+    elif len(frames) < 2:
+        results = [detect_faces_in_image(frame_path) for frame_path in frames]
+    else:
+        workers = min(os.cpu_count() or 1, len(frames))
+        chunksize = max(1, len(frames) // (4 * workers))
+        with mp.Pool(workers) as pool:
+            results = list(pool.imap(detect_faces_in_image, frames, chunksize=chunksize))
 
+    for result in results:
         if result["error"]:
             error_count += 1
         else:
             total_faces += len(result["faces"])
 
-    return {
+    output = {
         "results": results,
         "stats": {
             "frames_processed": len(frames),
@@ -119,11 +249,69 @@ def process_batch(input_data: dict) -> dict:
         }
     }
 
+    if input_data.get("emb_file"):
+        output["emb_file"] = save_embeddings(results, input_data["emb_file"])
+
+    return output
+
+
+def save_embeddings(results: list[dict], emb_file: str) -> str:
+    """
+    Move every face embedding out of results into a float32 (N, 128) .npy file.
+
+    Faces keep an "embedding_index" row number in place of the "embedding"
+    list, numbered in result order, so the file can go straight to
+    cluster_characters.py (via its "emb_file" field) without a JSON round trip.
+    """
+    rows = []
+    for result in results:
+        for face in result["faces"]:
+            face["embedding_index"] = len(rows)
+            rows.append(face.pop("embedding"))
+
+    embeddings = np.array(rows, dtype=np.float32).reshape(len(rows), 128)
+    # Through a file object so np.save doesn't append ".npy" to the given path
+    with open(emb_file, "wb") as f:
+        np.save(f, embeddings)
+    return emb_file
+
+
+def serve():
+    """
+    Answer newline-delimited JSON requests from stdin until EOF.
+
+    Keeps the process (and the loaded dlib models) alive across batches, so
+    callers pay the import cost once instead of per invocation.
+    """
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            input_data = _loads(line)
+        except json.JSONDecodeError as e:
+            output = {"error": f"Invalid JSON input: {e}"}
+        else:
+            if not isinstance(input_data, dict):
+                output = {"error": "Invalid input: expected a JSON object"}
+            else:
+                # One bad request (e.g. an unwritable emb_file) must not take
+                # the daemon down; report it and keep serving
+                try:
+                    output = process_batch(input_data)
+                except Exception as e:
+                    output = {"error": str(e)}
+        sys.stdout.write(_dumps(output) + "\n")
+        sys.stdout.flush()
+
 
 def main():
+    if "--serve" in sys.argv[1:]:
+        serve()
+        return
+
     # Read JSON from stdin
     try:
-        input_data = json.load(sys.stdin)
+        input_data = _loads(sys.stdin.buffer.read())
     except json.JSONDecodeError as e:
         print(json.dumps({"error": f"Invalid JSON input: {e}"}), file=sys.stdout)
         sys.exit(1)
@@ -132,7 +320,7 @@ def main():
     output = process_batch(input_data)
 
     # Write JSON to stdout
-    print(json.dumps(output))
+    print(_dumps(output))
 
 
 if __name__ == "__main__":
@@ -3,26 +3,59 @@
 Extract representative frames for each character.
 """
 
+import hashlib
 import json
+import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import orjson  # optional: clips.json is several MB, orjson parses it much faster
+except ImportError:
+    orjson = None
+
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 VIDEO_DIR = PROJECT_ROOT / "data" / "video"
 CHARS_JSON = PROJECT_ROOT / "docs" / "clip-metadata" / "characters.json"
 CLIPS_JSON = PROJECT_ROOT / "docs" / "clip-metadata" / "clips.json"
 OUTPUT_DIR = PROJECT_ROOT / "data" / "temp" / "char_frames"
 
+def load_json(path: Path):
+    """Load a JSON file, preferring orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path) as f:
+        return json.load(f)
+
+def extract_frame(video_path: Path, timestamp: float, frame_path: Path, key: str) -> bool:
+    """
+    Grab one frame with ffmpeg; returns whether the image exists afterwards.
+
+    A ".sha" sidecar records the cache key of the frame on disk, so re-runs
+    skip ffmpeg when the clip, timestamp and video file are unchanged.
+    """
+    sha_path = frame_path.with_suffix(".sha")
+    if frame_path.exists() and sha_path.exists() and sha_path.read_text() == key:
+        return True
+    sha_path.unlink(missing_ok=True)
+
+    cmd = [
+        "ffmpeg", "-y", "-threads", "1", "-ss", str(timestamp), "-i", str(video_path),
+        "-frames:v", "1", "-q:v", "2", str(frame_path)
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if proc.returncode == 0 and frame_path.exists():
+        sha_path.write_text(key)
+    return frame_path.exists()
+
 def main():
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    with open(CHARS_JSON) as f:
-        chars_db = json.load(f)
+    chars_db = load_json(CHARS_JSON)
+    clips_db = load_json(CLIPS_JSON)
 
-    with open(CLIPS_JSON) as f:
-        clips_db = json.load(f)
-
-    results = []
+    tasks = []
 
     for char_id, char in sorted(chars_db["characters"].items(), key=lambda x: -x[1]["occurrence_count"]):
         # Get first clip and face info
@@ -46,15 +79,17 @@ def main():
                 timestamp = face.get("frame_timestamp", 2.0)
                 break
 
-        # Extract frame
-        frame_path = OUTPUT_DIR / f"{char_id}.png"
-        cmd = [
-            "ffmpeg", "-y", "-ss", str(timestamp), "-i", str(video_path),
-            "-frames:v", "1", "-q:v", "2", str(frame_path)
-        ]
-        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        key = hashlib.sha1(f"{clip_id}:{timestamp}:{video_path.stat().st_mtime}".encode()).hexdigest()
+        tasks.append((char_id, char, clip_id, video_path, timestamp, OUTPUT_DIR / f"{char_id}.png", key))
 
-        if frame_path.exists():
+    # Each ffmpeg call is an independent process, so run several at once.
+    # They decode with -threads 1, so half the cores' worth won't oversubscribe.
+    with ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2)) as ex:
+        extracted = list(ex.map(lambda t: extract_frame(*t[3:]), tasks))
+
+    results = []
+    for (char_id, char, clip_id, _, _, frame_path, _), ok in zip(tasks, extracted):
+        if ok:
             results.append({
                 "char_id": char_id,
                 "faces": char["occurrence_count"],
@@ -9,14 +9,23 @@ import os
 import json
 import subprocess
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+try:
+    import orjson  # optional: much faster encoding of the embedding-heavy JSON files
+except ImportError:
+    orjson = None
 
 # Add parent to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from detect_faces import detect_faces_in_image
-from cluster_characters import cluster_faces
+from cluster_characters import cluster_embeddings
 
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 VIDEO_DIR = PROJECT_ROOT / "data" / "video"
@@ -26,8 +35,91 @@ CHARACTERS_JSON = PROJECT_ROOT / "docs" / "clip-metadata" / "characters.json"
 CENTROIDS_JSON = PROJECT_ROOT / "docs" / "clip-metadata" / "character_centroids.json"
 
 
+def load_json(path: Path):
+    """Load a JSON file, preferring orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(path: Path, data) -> None:
+    """
+    Write data as indented JSON in a single write, preferring orjson when installed.
+
+    Goes through a temp file and a rename so a crash mid-write never leaves a
+    truncated file behind.
+    """
+    tmp_path = path.with_suffix(".json.tmp")
+    if orjson is not None:
+        tmp_path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        tmp_path.write_text(json.dumps(data, indent=2))
+    os.replace(tmp_path, path)
+
+
+def _find_mp4_box(f, box_type: bytes, start: int, end: int) -> Optional[tuple[int, int]]:
+    """Return (payload start, box end) of the first box_type box in f[start:end], or None."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, header_len = int.from_bytes(header[:4], "big"), 8
+        if size == 1:  # 64-bit size follows the type
+            size, header_len = int.from_bytes(f.read(8), "big"), 16
+        elif size == 0:  # box runs to the end of its parent
+            size = end - pos
+        if size < header_len:
+            return None
+        if header[4:] == box_type:
+            return pos + header_len, pos + size
+        pos += size
+    return None
+
+
+def read_mp4_duration(video_path: str) -> Optional[float]:
+    """
+    Read the duration from an mp4's movie header (moov/mvhd) without ffprobe.
+
+    Only box headers are read, seeking past everything else, so it costs a
+    few small reads even when moov sits after mdat. Returns None if the
+    file doesn't parse as mp4.
+    """
+    try:
+        with open(video_path, "rb") as f:
+            file_end = f.seek(0, os.SEEK_END)
+            moov = _find_mp4_box(f, b"moov", 0, file_end)
+            mvhd = moov and _find_mp4_box(f, b"mvhd", *moov)
+            if not mvhd:
+                return None
+            f.seek(mvhd[0])
+            body = f.read(32)
+    except OSError:
+        return None
+
+    # Version 1 headers use 64-bit creation/modification times and duration
+    if body[:1] == b"\x01":
+        timescale, duration = body[20:24], body[24:32]
+    else:
+        timescale, duration = body[12:16], body[16:20]
+    if len(duration) not in (4, 8) or not int.from_bytes(timescale, "big"):
+        return None
+    # 0 (fragmented files, some muxers) and all-ones both mean "unknown":
+    # leave those to ffprobe
+    ticks = int.from_bytes(duration, "big")
+    if ticks == 0 or ticks == (1 << (8 * len(duration))) - 1:
+        return None
+    return ticks / int.from_bytes(timescale, "big")
+
+
 def get_video_duration(video_path: str) -> float:
-    """Get video duration using ffprobe."""
+    """Get video duration from the mp4 header, falling back to ffprobe."""
+    duration = read_mp4_duration(video_path)
+    if duration is not None:
+        return duration
+
     cmd = [
         "ffprobe", "-v", "quiet", "-show_entries", "format=duration",
         "-of", "csv=p=0", video_path
@@ -47,20 +139,64 @@ def extract_frames(video_path: str, clip_id: str) -> list[tuple[str, float]]:
     clip_dir = TEMP_DIR / clip_id
     clip_dir.mkdir(parents=True, exist_ok=True)
 
-    frame_paths = []
+    # Short clips can repeat a timestamp; grab (and later report) each frame once.
+    # Frames are throwaway, so write uncompressed BMP: PNG's deflate on write and
+    # inflate on read cost ~130ms per 1080p frame, BMP ~10ms.
+    frames = {f"frame_{ts:.2f}s.bmp": ts for ts in timestamps}
+    timestamps = list(frames.values())
+    frame_paths = [clip_dir / name for name in frames]
+
+    # One ffmpeg for all three grabs: each timestamp is its own input with an
+    # input-side seek, mapped to its own single-frame output
+    cmd = ["ffmpeg", "-y"]
     for ts in timestamps:
-        frame_path = clip_dir / f"frame_{ts:.2f}s.png"
-        cmd = [
-            "ffmpeg", "-y", "-ss", str(ts), "-i", video_path,
-            "-frames:v", "1", "-q:v", "2", str(frame_path)
-        ]
-        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        if frame_path.exists():
-            frame_paths.append((str(frame_path), ts))
+        cmd += ["-ss", str(ts), "-i", video_path]
+    for i, frame_path in enumerate(frame_paths):
+        cmd += ["-map", f"{i}:v:0", "-frames:v", "1", str(frame_path)]
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    frame_paths = [(str(fp), ts) for fp, ts in zip(frame_paths, timestamps) if fp.exists()]
 
     return frame_paths
 
 
+def process_clip(video_path: Path) -> Optional[list[dict]]:
+    """
+    Extract frames from one clip and detect faces in them (runs in a worker process).
+
+    Returns the clip's face entries, or None if no frames could be extracted.
+    """
+    clip_id = video_path.stem
+
+    # Extract frames
+    frame_data = extract_frames(str(video_path), clip_id)
+    if not frame_data:
+        return None
+
+    # Detect faces
+    clip_faces = []
+    for frame_path, timestamp in frame_data:
+        detection = detect_faces_in_image(frame_path)
+        if detection["error"]:
+            continue
+
+        for j, face in enumerate(detection["faces"]):
+            clip_faces.append({
+                "face_id": f"face_{clip_id}_{timestamp:.2f}_{j}",
+                "frame_timestamp": timestamp,
+                "location": face["location"],
+                "embedding": face["embedding"],
+                "character_id": None
+            })
+
+    # Clean up frames for this clip
+    clip_temp = TEMP_DIR / clip_id
+    if clip_temp.exists():
+        shutil.rmtree(clip_temp)
+
+    return clip_faces
+
+
 def main():
     print("=" * 60)
     print("FACE DETECTION - FULL BATCH PROCESSING")
@@ -71,8 +207,7 @@ def main():
         print(f"ERROR: {CLIPS_JSON} not found")
         sys.exit(1)
 
-    with open(CLIPS_JSON) as f:
-        clips_db = json.load(f)
+    clips_db = load_json(CLIPS_JSON)
 
     # Get all video files
     video_files = sorted(VIDEO_DIR.glob("*.mp4"))
@@ -81,103 +216,87 @@ def main():
     # Ensure temp dir
     TEMP_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Track all faces for clustering
-    all_faces = []
+    # Track all faces for clustering, as parallel lists rather than a dict per face;
+    # each face's clip is stored as an index into clip_names
+    face_ids: list[str] = []
+    face_clip_idx: list[int] = []
+    clip_names: list[str] = []
+    clip_rows: dict[str, range] = {}  # each clip's faces are a contiguous run of rows
+    embeddings: list[list[float]] = []
     clips_with_faces = 0
     clips_processed = 0
-    clips_skipped = 0
 
     print("\nProcessing clips...")
     print("-" * 60)
 
-    for i, video_path in enumerate(video_files):
-        clip_id = video_path.stem
+    # Skip videos not in clips.json (shouldn't happen)
+    known_videos = [v for v in video_files if v.stem in clips_db["clips"]]
+    clips_skipped = len(video_files) - len(known_videos)
 
-        # Progress indicator
-        if (i + 1) % 20 == 0 or i == 0:
-            print(f"  [{i+1}/{len(video_files)}] Processing {clip_id}...")
+    # Clips are independent and detection is single-threaded per frame, so
+    # spread them over all cores. map() keeps results in input order, which
+    # keeps clustering (and so character numbering) deterministic.
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        for i, (video_path, clip_faces) in enumerate(zip(known_videos, ex.map(process_clip, known_videos))):
+            clip_id = video_path.stem
 
-        # Skip if not in clips.json (shouldn't happen)
-        if clip_id not in clips_db["clips"]:
-            clips_skipped += 1
-            continue
+            # Progress indicator
+            if (i + 1) % 20 == 0 or i == 0:
+                print(f"  [{i+1}/{len(known_videos)}] Processed {clip_id}")
 
-        clip_data = clips_db["clips"][clip_id]
-
-        # Extract frames
-        frame_data = extract_frames(str(video_path), clip_id)
-        if not frame_data:
-            clips_skipped += 1
-            continue
-
-        # Detect faces
-        clip_faces = []
-        for frame_path, timestamp in frame_data:
-            detection = detect_faces_in_image(frame_path)
-            if detection["error"]:
+            if clip_faces is None:
+                clips_skipped += 1
                 continue
 
-            for j, face in enumerate(detection["faces"]):
-                face_id = f"face_{clip_id}_{timestamp:.2f}_{j}"
-                face_entry = {
-                    "face_id": face_id,
-                    "frame_timestamp": timestamp,
-                    "location": face["location"],
-                    "embedding": face["embedding"],
-                    "character_id": None
-                }
-                clip_faces.append(face_entry)
-                all_faces.append({
-                    "face_id": face_id,
-                    "clip_id": clip_id,
-                    "embedding": face["embedding"]
-                })
-
-        # Update clip metadata with faces
-        clip_data["faces"] = {
-            "detected_at": datetime.now().isoformat(),
-            "faces": clip_faces,
-            "total_faces": len(clip_faces),
-            "unique_characters": []
-        }
-
-        clips_processed += 1
-        if len(clip_faces) > 0:
-            clips_with_faces += 1
+            clip_idx = len(clip_names)
+            clip_names.append(clip_id)
+            clip_rows[clip_id] = range(len(face_ids), len(face_ids) + len(clip_faces))
+            for face in clip_faces:
+                face_ids.append(face["face_id"])
+                face_clip_idx.append(clip_idx)
+                embeddings.append(face["embedding"])
+
+            # Update clip metadata with faces
+            clips_db["clips"][clip_id]["faces"] = {
+                "detected_at": datetime.now().isoformat(),
+                "faces": clip_faces,
+                "total_faces": len(clip_faces),
+                "unique_characters": []
+            }
 
-        # Clean up frames for this clip
-        clip_temp = TEMP_DIR / clip_id
-        if clip_temp.exists():
-            shutil.rmtree(clip_temp)
+            clips_processed += 1
+            if len(clip_faces) > 0:
+                clips_with_faces += 1
 
     print("-" * 60)
     print(f"\nFace Detection Complete:")
     print(f"  Clips processed: {clips_processed}")
     print(f"  Clips with faces: {clips_with_faces}")
-    print(f"  Total faces detected: {len(all_faces)}")
+    print(f"  Total faces detected: {len(face_ids)}")
 
-    # Save updated clips.json
+    # clips.json is saved once, after character assignment below
     clips_db["updated_at"] = datetime.now().isoformat()
-    with open(CLIPS_JSON, "w") as f:
-        json.dump(clips_db, f, indent=2)
-    print(f"\nSaved face data to {CLIPS_JSON}")
 
     # Cluster faces
     print("\n" + "=" * 60)
     print("CLUSTERING FACES INTO CHARACTERS")
     print("=" * 60)
 
-    if len(all_faces) > 0:
-        cluster_input = [{"face_id": f["face_id"], "embedding": f["embedding"]} for f in all_faces]
-        cluster_result = cluster_faces(cluster_input, eps=0.5, min_samples=2)
+    if len(face_ids) > 0:
+        # Hand the embeddings over as one float32 matrix instead of per-face dicts
+        cluster_result = cluster_embeddings(
+            face_ids, np.array(embeddings, dtype=np.float32), eps=0.5, min_samples=2
+        )
 
         print(f"\nClustering Results:")
         print(f"  Characters found: {cluster_result['stats']['characters_found']}")
         print(f"  Faces assigned: {cluster_result['stats']['faces_assigned']}")
         print(f"  Faces unassigned: {cluster_result['stats']['faces_unassigned']}")
 
-        # Build face_id -> clip_id mapping
-        face_to_clip = {f["face_id"]: f["clip_id"] for f in all_faces}
+        # Build face_id -> row mapping once; a character's clips are then the
+        # unique clip indices of its rows
+        face_id_to_row = {fid: row for row, fid in enumerate(face_ids)}
+        clip_idx = np.array(face_clip_idx, dtype=np.int32)
 
         # Build character database (metadata only) and centroids database (stored separately)
         now = datetime.now().isoformat()
@@ -193,7 +312,8 @@ def main():
         }
 
         for char in cluster_result["characters"]:
-            clip_ids = list(set(face_to_clip[fid] for fid in char["face_ids"]))
+            rows = [face_id_to_row[fid] for fid in char["face_ids"]]
+            clip_ids = [clip_names[k] for k in np.unique(clip_idx[rows])]
             # Store centroid separately
             centroids_db["centroids"][char["character_id"]] = char["centroid"]
             # Store metadata without centroid
@@ -210,33 +330,26 @@ def main():
                 }
             }
 
-        # Update clips.json with character assignments
-        face_to_char = {}
-        for char in cluster_result["characters"]:
-            for fid in char["face_ids"]:
-                face_to_char[fid] = char["character_id"]
-
+        # Update clips.json with character assignments, by row position.
+        # Clips not processed in this run have no rows, so none of their faces match.
+        face_character_ids = cluster_result["face_character_ids"]
         for clip_id, clip_data in clips_db["clips"].items():
             if "faces" in clip_data and clip_data["faces"]:
                 unique_chars = set()
-                for face in clip_data["faces"]["faces"]:
-                    char_id = face_to_char.get(face["face_id"])
+                for face, row in zip(clip_data["faces"]["faces"], clip_rows.get(clip_id, ())):
+                    char_id = face_character_ids[row]
                     if char_id:
                         face["character_id"] = char_id
                         unique_chars.add(char_id)
                 clip_data["faces"]["unique_characters"] = sorted(list(unique_chars))
 
         # Save all files
-        with open(CLIPS_JSON, "w") as f:
-            json.dump(clips_db, f, indent=2)
-
-        with open(CHARACTERS_JSON, "w") as f:
-            json.dump(characters_db, f, indent=2)
-
-        with open(CENTROIDS_JSON, "w") as f:
-            json.dump(centroids_db, f, indent=2)
+        save_json(CLIPS_JSON, clips_db)
+        save_json(CHARACTERS_JSON, characters_db)
+        save_json(CENTROIDS_JSON, centroids_db)
 
-        print(f"\nSaved character metadata to {CHARACTERS_JSON}")
+        print(f"\nSaved face data to {CLIPS_JSON}")
+        print(f"Saved character metadata to {CHARACTERS_JSON}")
         print(f"Saved centroids to {CENTROIDS_JSON}")
 
         # Print character summary
@@ -255,6 +368,8 @@ def main():
 
     else:
         print("\nNo faces detected, skipping clustering.")
+        save_json(CLIPS_JSON, clips_db)
+        print(f"Saved face data to {CLIPS_JSON}")
 
     # Clean up temp directory
     if TEMP_DIR.exists():
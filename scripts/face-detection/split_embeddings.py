@@ -6,14 +6,32 @@ Split characters.json into lightweight metadata and separate centroids file.
 import json
 from pathlib import Path
 
+try:
+    import orjson  # optional: much faster encoding of the embedding-heavy JSON files
+except ImportError:
+    orjson = None
+
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 CHARS_JSON = PROJECT_ROOT / "docs" / "clip-metadata" / "characters.json"
 CENTROIDS_JSON = PROJECT_ROOT / "docs" / "clip-metadata" / "character_centroids.json"
 
+def load_json(path: Path):
+    """Load a JSON file, preferring orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path) as f:
+        return json.load(f)
+
+def save_json(path: Path, data) -> None:
+    """Write data as indented JSON in a single write, preferring orjson when installed."""
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        path.write_text(json.dumps(data, indent=2))
+
 def main():
     # Load current characters
-    with open(CHARS_JSON) as f:
-        data = json.load(f)
+    data = load_json(CHARS_JSON)
 
     # Extract centroids into separate structure
     centroids = {
@@ -28,12 +46,10 @@ def main():
             centroids["centroids"][char_id] = char_data.pop("centroid")
 
     # Save lightweight characters.json
-    with open(CHARS_JSON, "w") as f:
-        json.dump(data, f, indent=2)
+    save_json(CHARS_JSON, data)
 
     # Save centroids to separate file
-    with open(CENTROIDS_JSON, "w") as f:
-        json.dump(centroids, f, indent=2)
+    save_json(CENTROIDS_JSON, centroids)
 
     # Report sizes
     chars_size = CHARS_JSON.stat().st_size
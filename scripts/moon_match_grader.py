@@ -21,7 +21,9 @@ def find_moon_centroid(image_path, roi_bounds=(0.05, 0.55, 0.15, 0.55), debug=Fa
 
     Returns: (x, y) centroid in ROI coordinates, or None if not found
     """
-    img = cv2.imread(str(image_path))
+    # Decode straight to grayscale: the detector only looks at brightness, so
+    # this skips the BGR->gray pass (and, for JPEG, the chroma upsampling).
+    img = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
     if img is None:
         print(f"Error: Could not read {image_path}")
         return None
@@ -34,10 +36,7 @@ def find_moon_centroid(image_path, roi_bounds=(0.05, 0.55, 0.15, 0.55), debug=Fa
     y1 = int(h * roi_bounds[2])
     y2 = int(h * roi_bounds[3])
 
-    roi = img[y1:y2, x1:x2]
-
-    # Convert to grayscale
-    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    gray = img[y1:y2, x1:x2]
 
     # Threshold to find bright regions (moon should be brightest)
     # Use adaptive threshold based on max brightness
@@ -92,13 +91,13 @@ def find_moon_centroid(image_path, roi_bounds=(0.05, 0.55, 0.15, 0.55), debug=Fa
     cy = int(M["m01"] / M["m00"])
 
     # Normalize to ROI size (0-1 range)
-    roi_h, roi_w = roi.shape[:2]
+    roi_h, roi_w = gray.shape[:2]
     cx_norm = cx / roi_w
     cy_norm = cy / roi_h
 
     if debug:
         # Draw debug visualization
-        debug_img = roi.copy()
+        debug_img = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
         cv2.drawContours(debug_img, [best_contour], -1, (0, 255, 0), 2)
         cv2.circle(debug_img, (cx, cy), 5, (0, 0, 255), -1)
         debug_path = Path(image_path).stem + "_moon_debug.png"